@@ -21,6 +21,9 @@ export default function BetFeed() {
   const url_path = useAppSelector(selectPath);
 
   const [accums, setAccums] = React.useState<Accums[]>([]);
+  const [hasMore, setHasMore] = React.useState<boolean>(false);
+
+  const PAGE_SIZE = 50;
 
   const [responseCode, setResponseCode] = React.useState<number>();
   const [responseText, setResponseText] = React.useState<number>();
@@ -41,14 +44,22 @@ export default function BetFeed() {
     setAlertType({ type: type, msg: msg });
   }
 
-  const fetchBets = async () => {
-    const response = await fetch(`${url_path}api/allaccums`, {
+  const fetchBets = async (after?: Accums) => {
+    let query = `?limit=${PAGE_SIZE}`;
+    if (after) {
+      query +=
+        `&before_timestamp=${encodeURIComponent(
+          after.placed_timestamp.toString()
+        )}` + `&before_id=${after.accum_id}`;
+    }
+    const response = await fetch(`${url_path}api/allaccums${query}`, {
       headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
     });
     const resp = await response.json();
     setResponseCode(response.status);
     if (response.status == 200) {
-      setAccums(resp);
+      setAccums((prevAccums) => (after ? [...prevAccums, ...resp] : resp));
+      setHasMore(resp.length === PAGE_SIZE);
     } else {
       setResponseText(resp.detail);
     }
@@ -227,6 +238,15 @@ export default function BetFeed() {
           );
         })}
       </div>
+      {hasMore && (
+        <Button
+          variant="contained"
+          sx={{ marginTop: 2, marginBottom: 2 }}
+          onClick={() => fetchBets(accums[accums.length - 1])}
+        >
+          Vis flere
+        </Button>
+      )}
     </>
   );
 }
@@ -18,7 +18,7 @@ import {
   Switch,
   TextField,
 } from "@mui/material";
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import {
   BondeUser,
   Player,
@@ -86,6 +86,15 @@ export default function BondeBridge() {
 
   const [currentGame, setCurrentGame] = useState<Game>();
 
+  // What the server has, keyed by id, so only changed cells are sent
+  const synced = useRef<{
+    version: number | null;
+    scores: Record<number, string>;
+    players: Record<number, string>;
+  }>({ version: null, scores: {}, players: {} });
+  // Syncs run one after another so each one sends the version of the last
+  const syncQueue = useRef<Promise<void>>(Promise.resolve());
+
   const [reBidState, setReBidState] = useState<boolean>(false);
 
   const [blueberryMode, setBlueberryMode] = useState<boolean>(false);
@@ -482,6 +491,48 @@ export default function BondeBridge() {
     }
   }
 
+  function applyGame(data: any) {
+    synced.current = {
+      version: data.game.version,
+      scores: Object.fromEntries(
+        data.rounds.flatMap((round: Round) =>
+          round.player_scores.map((ps) => [ps.player_scores_id, scoreKey(ps)]),
+        ),
+      ),
+      players: Object.fromEntries(
+        data.players.map((player: Player) => [
+          player.game_player_id,
+          playerKey(player),
+        ]),
+      ),
+    };
+
+    setCurrentGame(data.game);
+    setRounds(data.rounds);
+    setPlayers(data.players);
+    setInitials(getInitials(data.players));
+
+    let lastIndex = 0;
+
+    if (data.game.status === "finished") {
+      setCurrentRoundIndex(data.rounds.length - 1);
+    } else {
+      for (let i = 0; i < data.rounds.length; i++) {
+        const round = data.rounds[i];
+        const isSettled = round.player_scores.every(
+          (playerScore: PlayerScore) => typeof playerScore.stand === "boolean",
+        );
+
+        if (isSettled) {
+          lastIndex = i + 1;
+        } else {
+          break;
+        }
+      }
+      setCurrentRoundIndex(lastIndex);
+    }
+  }
+
   const fetchGame = async () => {
     try {
       const response = await fetch(`${url_path}api/bonde/game/${GAME_ID}`);
@@ -496,33 +547,7 @@ export default function BondeBridge() {
         return;
       }
 
-      const data = await response.json();
-
-      setCurrentGame(data.game);
-      setRounds(data.rounds);
-      setPlayers(data.players);
-      setInitials(getInitials(data.players));
-
-      let lastIndex = 0;
-
-      if (data.game.status === "finished") {
-        setCurrentRoundIndex(data.rounds.length - 1);
-      } else {
-        for (let i = 0; i < data.rounds.length; i++) {
-          const round = data.rounds[i];
-          const isSettled = round.player_scores.every(
-            (playerScore: PlayerScore) =>
-              typeof playerScore.stand === "boolean",
-          );
-
-          if (isSettled) {
-            lastIndex = i + 1;
-          } else {
-            break;
-          }
-        }
-        setCurrentRoundIndex(lastIndex);
-      }
+      applyGame(await response.json());
     } catch (err) {
       setError("Noe gikk galt. Kunne ikke hente nåværende spill");
       console.error(err);
@@ -531,6 +556,23 @@ export default function BondeBridge() {
 
   useEffect(() => {
     fetchGame();
+
+    // Changes made on other devices are pushed as they are saved
+    const source = new EventSource(
+      `${url_path}api/bonde/game/${GAME_ID}/events`,
+    );
+    source.addEventListener("game", async (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      // Our own pending writes come back as pushes too, only apply newer ones
+      await syncQueue.current;
+      if (
+        synced.current.version === null ||
+        data.game.version > synced.current.version
+      ) {
+        applyGame(data);
+      }
+    });
+    return () => source.close();
   }, []);
 
   function getPlayerEarnings(place: number) {
@@ -585,7 +627,7 @@ export default function BondeBridge() {
   useEffect(() => {
     if (currentGame) {
       calcMoneyPrizes();
-      updatePlayerScores();
+      syncGame();
     }
   }, [players]);
   // useEffect(() => {
@@ -594,62 +636,101 @@ export default function BondeBridge() {
   // }, [players]);
 
   useEffect(() => {
-    updatePlayerScores();
+    syncGame();
     calcScores();
-    updateRound();
   }, [currentRoundIndex]);
 
   useEffect(() => {
     if (currentGame?.status === "finished") {
-      updatePlayerScores();
-      updateRound();
+      syncGame();
     }
   }, [currentGame]);
-  async function updateRound() {
+  function scoreKey(score: PlayerScore) {
+    return `${score.num_tricks}|${score.stand}`;
+  }
+
+  function playerKey(player: Player) {
+    return `${player.score}|${player.warnings}|${player.bleedings}`;
+  }
+
+  function syncGame() {
+    syncQueue.current = syncQueue.current.then(() =>
+      sendChanges(rounds, players),
+    );
+  }
+
+  // Sends the cells and player totals that changed since the last sync
+  async function sendChanges(rounds: Round[], players: Player[]) {
+    const version = synced.current.version;
+    if (version === null) {
+      return;
+    }
+    const changedScores = rounds
+      .flatMap((round) => round.player_scores)
+      .filter(
+        (ps) =>
+          ps.player_scores_id !== undefined &&
+          synced.current.scores[ps.player_scores_id] !== scoreKey(ps),
+      );
+    const changedPlayers = players.filter(
+      (player) =>
+        synced.current.players[player.game_player_id] !== playerKey(player),
+    );
+    if (changedScores.length === 0 && changedPlayers.length === 0) {
+      return;
+    }
+
     try {
-      const response = await fetch(`${url_path}api/bonde/rounds`, {
-        method: "PUT",
+      const response = await fetch(`${url_path}api/bonde/game/${GAME_ID}`, {
+        method: "PATCH",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify({ rounds: rounds }),
+        body: JSON.stringify({
+          version: version,
+          player_scores: changedScores.map((ps) => ({
+            player_scores_id: ps.player_scores_id,
+            num_tricks: ps.num_tricks,
+            stand: ps.stand,
+          })),
+          players: changedPlayers.map((player) => ({
+            game_player_id: player.game_player_id,
+            score: player.score,
+            warnings: player.warnings,
+            bleedings: player.bleedings,
+          })),
+        }),
       });
 
+      if (response.status === 409) {
+        // Someone else updated the game first, continue from their version
+        console.warn("Game was changed elsewhere, fetching the latest version");
+        await fetchGame();
+        return;
+      }
       if (!response.ok) {
-        throw new Error(`Failed to update round: ${response.statusText}`);
+        throw new Error(`Failed to update game: ${response.statusText}`);
       }
 
       const data = await response.json();
+      synced.current.version = data.version;
+      changedScores.forEach((ps) => {
+        synced.current.scores[ps.player_scores_id as number] = scoreKey(ps);
+      });
+      changedPlayers.forEach((player) => {
+        synced.current.players[player.game_player_id] = playerKey(player);
+      });
     } catch (error) {
-      console.error("Error updating round:", error);
+      console.error("Error updating game:", error);
     }
   }
 
-  async function updatePlayerScores() {
-    if (players.length > 0) {
-      try {
-        const response = await fetch(`${url_path}api/bonde/playerdata`, {
-          method: "PUT",
-          headers: {
-            "Content-Type": "application/json",
-          },
-          body: JSON.stringify({ playerData: players }),
-        });
-
-        if (!response.ok) {
-          throw new Error(
-            `Failed to update player scores: ${response.statusText}`,
-          );
-        }
-
-        const data = await response.json();
-      } catch (error) {
-        console.error("Error updating player scores:", error);
-      }
-    }
+  function completeGame(game_id: number) {
+    // Queued behind pending changes, so they reach the server first
+    syncQueue.current = syncQueue.current.then(() => sendComplete(game_id));
   }
 
-  async function completeGame(game_id: number) {
+  async function sendComplete(game_id: number) {
     try {
       const response = await fetch(
         `${url_path}api/bonde/game/complete/${game_id}`,
@@ -663,16 +744,16 @@ export default function BondeBridge() {
 
       if (!response.ok) {
         throw new Error(`${response.statusText}`);
-      } else {
-        if (currentGame) {
-          setCurrentGame({
-            ...currentGame,
-            status: "finished",
-          });
-        }
       }
 
       const data = await response.json();
+      synced.current.version = data.version;
+      if (currentGame) {
+        setCurrentGame({
+          ...currentGame,
+          status: "finished",
+        });
+      }
     } catch (error) {
       console.error(error);
     }
@@ -142,6 +142,9 @@ export default function BondeBridgeHome() {
   const [games, setGames] = useState<Game[]>([]);
   const [page, setPage] = useState(1);
   const [totalPages, setTotalPages] = useState(1);
+  const [nextBeforeGameId, setNextBeforeGameId] = useState<number | null>(
+    null,
+  );
   const [loading, setLoading] = useState(true);
 
   const [dealerIndex, setDealerIndex] = useState<number>(0);
@@ -165,7 +168,7 @@ export default function BondeBridgeHome() {
 
   async function initGame() {
     try {
-      // Step 1: Create a new game and get the game ID
+      // Create the game, its players and all its (empty) rounds in one request
       const gameResponse = await fetch(`${url_path}api/bonde/game`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -174,10 +177,10 @@ export default function BondeBridgeHome() {
           extra_cost_loser: extraCostLoser,
           extra_cost_second_last: extraCostSecondLast,
           money_multiplier: moneyMultiplier,
+          rounds: generateRounds(),
         }),
       });
-      const { game_id, created_on, game_player_ids } =
-        await gameResponse.json();
+      const { game_id, game_player_ids, created } = await gameResponse.json();
 
       const updatedPlayers = players.map((player, index) => ({
         ...player,
@@ -186,24 +189,6 @@ export default function BondeBridgeHome() {
 
       setPlayers(updatedPlayers);
 
-      // Steps 2 and 3: Generate rounds and send them to the backend
-      let tempRounds = generateRounds(); // Function to generate empty rounds
-      console.log({
-        game_id: game_id,
-        rounds: tempRounds,
-        game_player_ids: game_player_ids.sort(),
-      });
-      const roundsResponse = await fetch(`${url_path}api/bonde/rounds`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
-          game_id: game_id,
-          rounds: tempRounds,
-          game_player_ids: game_player_ids.sort(),
-        }),
-      });
-
-      const { created } = await roundsResponse.json();
       if (created) {
         handleSnackClick();
         navigate(`/bondebridge/${game_id}`);
@@ -354,12 +339,15 @@ export default function BondeBridgeHome() {
   const fetchGames = async (pageNumber = 1) => {
     setLoading(true);
     try {
-      const response = await fetch(
-        `${url_path}api/bonde/games?page=${pageNumber}`,
-      );
+      const cursor =
+        pageNumber > 1 && nextBeforeGameId !== null
+          ? `before_game_id=${nextBeforeGameId}`
+          : `page=${pageNumber}`;
+      const response = await fetch(`${url_path}api/bonde/games?${cursor}`);
       const data = await response.json();
       setGames((prevGames) => [...prevGames, ...data.games]);
       setTotalPages(data.totalPages);
+      setNextBeforeGameId(data.nextBeforeGameId);
       setPage(pageNumber);
     } catch (err) {
       setError("Noe gikk galt. Kunne ikke hente eksisterende spill");
@@ -33,12 +33,16 @@ import SentimentVerySatisfiedIcon from "@mui/icons-material/SentimentVerySatisfi
 import SentimentSatisfiedIcon from "@mui/icons-material/SentimentSatisfied";
 import SentimentDissatisfiedIcon from "@mui/icons-material/SentimentDissatisfied";
 
-const SORT_FILTERS = [
-  "Nyeste",
-  "Eldste",
-  "Hyppighet synkende",
-  "Hyppighet stigende",
-];
+// Sort label -> sort parameter of /api/dictionary
+const SORT_FILTERS: Record<string, string> = {
+  Nyeste: "newest",
+  Eldste: "oldest",
+  "Hyppighet synkende": "frequency_desc",
+  "Hyppighet stigende": "frequency_asc",
+};
+
+const ALL_SUBMITTERS = "Alle bidragsytere";
+const PAGE_SIZE = 50;
 
 export default function Dictionary() {
   const USERNAME = useAppSelector(selectUsername);
@@ -47,13 +51,15 @@ export default function Dictionary() {
   const url_path = useAppSelector(selectPath);
 
   const [dictionary, setDictionary] = React.useState<DictionaryT[]>([]);
+  const [hasMore, setHasMore] = React.useState<boolean>(false);
+  const [search, setSearch] = React.useState<string>("");
 
   const [responseCode, setResponseCode] = React.useState<number>();
   const [responseText, setResponseText] = React.useState<number>();
 
   const [persons, setPersons] = React.useState<string[]>([]);
   const [chosenPerson, setChosenPerson] =
-    React.useState<string>("Alle bidragsytere");
+    React.useState<string>(ALL_SUBMITTERS);
 
   const [chosenFilter, setChosenFilter] = React.useState<string>("Nyeste");
 
@@ -215,8 +221,23 @@ export default function Dictionary() {
     }
   };
 
-  async function fetchDictionary() {
-    const response = await fetch(`${url_path}api/dictionary`, {
+  // Searching, filtering and sorting happen on the server, one page at a time
+  async function fetchDictionary(after?: DictionaryT) {
+    const sort = SORT_FILTERS[chosenFilter];
+    const params = new URLSearchParams({ limit: `${PAGE_SIZE}`, sort: sort });
+    if (search.trim() !== "") {
+      params.set("q", search.trim());
+    }
+    if (chosenPerson !== ALL_SUBMITTERS) {
+      params.set("submitter", chosenPerson);
+    }
+    if (after) {
+      params.set("before_id", `${after.word_id}`);
+      if (sort.startsWith("frequency")) {
+        params.set("before_frequency", `${after.frequency ?? 0}`);
+      }
+    }
+    const response = await fetch(`${url_path}api/dictionary?${params}`, {
       headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
     });
 
@@ -224,19 +245,25 @@ export default function Dictionary() {
     setResponseCode(response.status);
 
     if (response.status == 200) {
-      setDictionary(resp);
-      let persons: string[] = ["Alle bidragsytere"];
-      resp.forEach((word: DictionaryT) => {
-        if (persons.indexOf(word.submitter.toLowerCase()) === -1) {
-          persons.push(word.submitter.toLowerCase());
-        }
-      });
-      setPersons(persons);
+      setDictionary((prevDictionary) =>
+        after ? [...prevDictionary, ...resp] : resp
+      );
+      setHasMore(resp.length === PAGE_SIZE);
     } else {
       setResponseText(resp.detail);
     }
   }
 
+  async function fetchSubmitters() {
+    const response = await fetch(`${url_path}api/dictionary/submitters`, {
+      headers: { Authorization: `Bearer ${localStorage.getItem("jwt")}` },
+    });
+    if (response.status == 200) {
+      const submitters: string[] = await response.json();
+      setPersons([ALL_SUBMITTERS, ...submitters]);
+    }
+  }
+
   async function updateWord() {
     if (!selectedWord) return;
 
@@ -303,19 +330,7 @@ export default function Dictionary() {
   };
 
   const handleFilterChange = (event: string) => {
-    let oldValue = [...dictionary];
-
-    if (event == "Nyeste") {
-      oldValue.sort((a, b) => (a.word_id < b.word_id ? 1 : -1));
-    } else if (event == "Eldste") {
-      oldValue.sort((a, b) => (a.word_id > b.word_id ? 1 : -1));
-    } else if (event == "Hyppighet synkende") {
-      oldValue.sort((a, b) => (a.frequency < b.frequency ? 1 : -1));
-    } else {
-      oldValue.sort((a, b) => (a.frequency > b.frequency ? 1 : -1));
-    }
     setChosenFilter(event);
-    setDictionary(oldValue);
   };
 
   const handleSliderChange = (event: Event, newValue: number | number[]) => {
@@ -353,6 +368,7 @@ export default function Dictionary() {
     const resp = await response.json();
     if (response.ok) {
       fetchDictionary();
+      fetchSubmitters();
       toggleAlert(true, "Ordet ble sendt inn til ordboka!", "success");
       setWord("");
       setFrequency(5);
@@ -379,9 +395,15 @@ export default function Dictionary() {
   }
 
   useEffect(() => {
-    fetchDictionary();
+    fetchSubmitters();
   }, []);
 
+  useEffect(() => {
+    // Wait for a pause in typing before searching
+    const timer = setTimeout(() => fetchDictionary(), 250);
+    return () => clearTimeout(timer);
+  }, [search, chosenFilter, chosenPerson]);
+
   const [openedMenuId, setOpenedMenuId] = React.useState<number | null>(null);
 
   function toggleMenu(e: React.MouseEvent<HTMLButtonElement>, word_id: number) {
@@ -471,6 +493,13 @@ export default function Dictionary() {
         </Card>
       </div>
       <br />
+      <TextField
+        label="Søk i ordboka"
+        value={search}
+        onChange={(e) => setSearch(e.target.value)}
+      />
+      <br />
+      <br />
       <InputLabel id="demo-simple-select-label">Sorter etter</InputLabel>
       <Select
         labelId="demo-simple-select-label"
@@ -479,7 +508,7 @@ export default function Dictionary() {
           handleFilterChange(e.target.value);
         }}
       >
-        {SORT_FILTERS.map((filter: string) => {
+        {Object.keys(SORT_FILTERS).map((filter: string) => {
           return <MenuItem value={filter}>{filter}</MenuItem>;
         })}
       </Select>
@@ -500,78 +529,73 @@ export default function Dictionary() {
       </Tabs>
       <div className="accums-flex-container">
         {dictionary.map((word: DictionaryT) => {
-          if (
-            chosenPerson == "Alle bidragsytere" ||
-            chosenPerson == word.submitter.toLowerCase()
-          ) {
-            return (
-              <>
-                <div>
-                  <Card
-                    sx={{
-                      overflow: "visible",
-                      backgroundColor: "white",
-                      padding: 1,
-                      width: 345,
-                      position: "relative", // This ensures the IconButton is positioned relative to the Card
-                    }}
-                  >
-                    {word.submitter.toLowerCase() === USERNAME.toLowerCase() ||
-                    isAdmin ? (
-                      <div className="word-card">
-                        <h3>{word.word}</h3>
+          return (
+            <>
+              <div>
+                <Card
+                  sx={{
+                    overflow: "visible",
+                    backgroundColor: "white",
+                    padding: 1,
+                    width: 345,
+                    position: "relative", // This ensures the IconButton is positioned relative to the Card
+                  }}
+                >
+                  {word.submitter.toLowerCase() === USERNAME.toLowerCase() ||
+                  isAdmin ? (
+                    <div className="word-card">
+                      <h3>{word.word}</h3>
+                      <button
+                        className="kebab-menu"
+                        onClick={(e) => toggleMenu(e, word.word_id)}
+                      >
+                        &#8942;
+                      </button>
+                      <div
+                        className="menu"
+                        style={{
+                          borderRadius: 6,
+                          display:
+                            openedMenuId === word.word_id ? "block" : "none",
+                        }}
+                      >
                         <button
-                          className="kebab-menu"
-                          onClick={(e) => toggleMenu(e, word.word_id)}
+                          onClick={() => handleClose("Endre tittel", word)}
                         >
-                          &#8942;
+                          Endre tittel
                         </button>
-                        <div
-                          className="menu"
-                          style={{
-                            borderRadius: 6,
-                            display:
-                              openedMenuId === word.word_id ? "block" : "none",
-                          }}
+                        <Divider />
+                        <button
+                          onClick={() => handleClose("Endre hyppighet", word)}
                         >
-                          <button
-                            onClick={() => handleClose("Endre tittel", word)}
-                          >
-                            Endre tittel
-                          </button>
-                          <Divider />
-                          <button
-                            onClick={() => handleClose("Endre hyppighet", word)}
-                          >
-                            Endre hyppighet
-                          </button>
-                          <Divider />
-                          <button
-                            onClick={() =>
-                              handleClose("Endre beskrivelse", word)
-                            }
-                          >
-                            Endre beskrivelse
-                          </button>
-                          <Divider />
-                          <button
-                            onClick={() => handleClose("Slett ord", word)}
-                          >
-                            Slett ord
-                          </button>
-                        </div>
+                          Endre hyppighet
+                        </button>
+                        <Divider />
+                        <button
+                          onClick={() =>
+                            handleClose("Endre beskrivelse", word)
+                          }
+                        >
+                          Endre beskrivelse
+                        </button>
+                        <Divider />
+                        <button
+                          onClick={() => handleClose("Slett ord", word)}
+                        >
+                          Slett ord
+                        </button>
                       </div>
-                    ) : (
-                      <h3>{word.word}</h3>
-                    )}
-                    Hyppighet: {word.frequency} <br />
-                    Innsendt av: {word.submitter} <br />
-                    {word.description} <br />
-                  </Card>
-                </div>
-              </>
-            );
-          }
+                    </div>
+                  ) : (
+                    <h3>{word.word}</h3>
+                  )}
+                  Hyppighet: {word.frequency} <br />
+                  Innsendt av: {word.submitter} <br />
+                  {word.description} <br />
+                </Card>
+              </div>
+            </>
+          );
         })}
         <Modal
           open={modalOpen}
@@ -595,6 +619,15 @@ export default function Dictionary() {
           </div>
         </Modal>
       </div>
+      {hasMore && (
+        <Button
+          variant="contained"
+          sx={{ marginTop: 2, marginBottom: 2 }}
+          onClick={() => fetchDictionary(dictionary[dictionary.length - 1])}
+        >
+          Vis flere
+        </Button>
+      )}
     </>
   );
 }
@@ -161,6 +161,7 @@ export type Game = {
   extra_cost_second_last: number;
   created_on: Date;
   players: GamePlayer[];
+  version?: number;
 };
 
 export type Player = {
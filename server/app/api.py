@@ -1,119 +1,85 @@
+from collections import defaultdict
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi import FastAPI, Depends
-import psycopg2
-from postgresPool import pool
-from string import Template
-import bcrypt
 from auth_utils import authUtils
-from psycopg2.extras import RealDictCursor
+from hash_utils import passwordHasher
+from user_cache import userCache
+from odds_snapshot import OddsSnapshot
+from http_cache import etag_matches
+from fast_json import FastJSONResponse
 import datetime
 import pytz
 from dateutil import parser
 from zoneinfo import ZoneInfo
 from pydantic import BaseModel
-
-from psycopg2.errors import UniqueViolation
-from psycopg2 import IntegrityError
+import json
+import os
 
 
 from db_instance import database
+from db_utils import fetchDB, fetchDBJson, fetchOneDBJson, insertDB
+from settlement import settle_market
+
+api_router = APIRouter(default_response_class=FastJSONResponse)
+
+OPEN_BETS_CONDITION = "bets.bet_status = 1 and bets.is_accepted = true and bets.close_timestamp > NOW() and bets.closed_early IS NULL"
+
+
+async def fetch_bets_with_options(condition="true", order_by="bets.bet_id"):
+    # Loads bets with their options nested under "bet_options" in one round trip
+    bets = await fetchDBJson(f"""
+        select bets.*,
+            coalesce(
+                json_agg(
+                    json_build_object(
+                        'option_id', bet_options.option_id,
+                        'latest_odds', bet_options.latest_odds,
+                        'option_status', bet_options.option_status,
+                        'option', bet_options.option
+                    ) order by bet_options.option_id
+                ) filter (where bet_options.option_id is not null),
+                '[]'
+            ) as bet_options
+        from bets
+        left join bet_options on bet_options.bet = bets.bet_id
+        where {condition}
+        group by bets.bet_id
+        order by {order_by}
+        """)
+    for bet in bets:
+        if isinstance(bet["bet_options"], str):
+            bet["bet_options"] = json.loads(bet["bet_options"])
+    return bets
 
-try:
-    connection = pool.getconn()
-
-except (Exception, psycopg2.DatabaseError) as error:
-    print("Error while connecting to PostgreSQL", error)
-
-
-def fetchDB(query):
-    cursor = connection.cursor()
-    cursor.execute(query)
-    result = cursor.fetchall()
-    return result
-
-
-def fetchDBJson(query):
-    cursor = connection.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(query)
-    result = cursor.fetchall()
-    return result
-
-
-def fetchDBJsonNew(query, params=None):
-    cursor = connection.cursor(cursor_factory=RealDictCursor)
-    try:
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        result = cursor.fetchall()
-        return result
-    except Exception as e:
-        print("Error:", e)
-        return None
-
-
-def insertDB(query):
-    cursor = connection.cursor()
-    cursor.execute(query)
-    connection.commit()
-
-
-# conn = psycopg2.connect(
-# host=Credentials.host,
-# database=Credentials.db,
-# user=Credentials.user,
-# password=Credentials.password,
-# )
-# # create a cursor
-# cur = conn.cursor()
-
-
-# # execute a statement
-# print("PostgreSQL database version:")
-# cur.execute("SELECT * from accounts;")
 
-# # display the PostgreSQL database server version
-# db_version = cur.fetchone()
-# print(db_version)
+async def fetch_open_bets():
+    return await fetch_bets_with_options(
+        OPEN_BETS_CONDITION, "bets.close_timestamp ASC"
+    )
 
 
-api_router = APIRouter()
+# Invalidated by every admin endpoint that changes open bets or their odds
+oddsSnapshot = OddsSnapshot(
+    fetch_open_bets, ttl=float(os.environ.get("ODDS_SNAPSHOT_TTL", 10))
+)
 
 
 @api_router.get("/api/openbets")
-async def get_open_bets(token: str = Depends(authUtils.validate_access_token)):
-    bets = fetchDBJson(
-        "select * from bets where bet_status = 1 and is_accepted = true and close_timestamp > NOW() and closed_early IS NULL ORDER BY close_timestamp ASC"
-    )
-    bets_with_options = []
-    for bet in bets:
-        options = fetchDBJson(
-            Template(
-                "select option_id, latest_odds, option_status, option from bet_options where bet = $bet"
-            ).safe_substitute({"bet": bet["bet_id"]})
-        )
-        bet_with_option = bet
-        bet_with_option["bet_options"] = options
-        bets_with_options.append(bet_with_option)
-    return bets_with_options
+async def get_open_bets(
+    request: Request, token: str = Depends(authUtils.validate_access_token)
+):
+    etag, body = await oddsSnapshot.get()
+    # no-cache makes the browser revalidate with If-None-Match on every fetch
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @api_router.get("/api/requestedbets")
 async def get_open_bets(token: str = Depends(authUtils.validate_access_token)):
-    bets = fetchDBJson("select * from bets where is_accepted = false")
-    bets_with_options = []
-    for bet in bets:
-        options = fetchDBJson(
-            Template(
-                "select option_id, latest_odds, option_status, option from bet_options where bet = $bet"
-            ).safe_substitute({"bet": bet["bet_id"]})
-        )
-        bet_with_option = bet
-        bet_with_option["bet_options"] = options
-        bets_with_options.append(bet_with_option)
-    return bets_with_options
+    return await fetch_bets_with_options("bets.is_accepted = false")
 
 
 # leaderboard date range, currently not implemented
@@ -130,35 +96,19 @@ async def get_leaderboard(
 ):
     leaderboard_data = []
     try:
-        users = fetchDBJson("select username, user_id, balance from users")
-        for user in users:
-            user_data = {"username": user["username"], "balance": user["balance"]}
-            won_accums = fetchDBJson(
-                Template(
-                    "select count(*) from accums where user_id = $user_id and paid_out=true"
-                ).safe_substitute({"user_id": user["user_id"]})
-            )
-            total_accums = fetchDBJson(
-                Template(
-                    "select count(*) from accums where user_id = $user_id"
-                ).safe_substitute({"user_id": user["user_id"]})
-            )
-            user_data["won_accums"] = won_accums[0]["count"]
-            user_data["total_accums"] = total_accums[0]["count"]
-
-            leaderboard_data.append(user_data)
+        # Counters are kept up to date by placebet and settlebet,
+        # see maintenance.py for rebuilding them from scratch
+        leaderboard_data = await fetchDBJson(
+            "select username, balance, coalesce(won_accums, 0) as won_accums, coalesce(total_accums, 0) as total_accums, coalesce(total_staked, 0) as total_staked, coalesce(total_paid_out, 0) as total_paid_out from users left join user_stats on users.user_id = user_stats.user_id order by users.user_id"
+        )
     except Exception as e:
         print("feil her", e)
     return leaderboard_data
 
 
-def is_admin(username):
-    res = fetchDBJson(
-        Template(
-            "select admin from users where username = '$username'"
-        ).safe_substitute({"username": username})
-    )
-    if res[0]["admin"]:
+async def is_admin(username):
+    user = await userCache.get(username)
+    if user and user["admin"]:
         return True
     else:
         return False
@@ -168,32 +118,92 @@ def is_admin(username):
 async def get_all_admin_bets(
     token: str = Depends(authUtils.validate_access_token),
 ):
-    if is_admin(token["user"]):
-        bets = fetchDBJson("select * from bets")
-        bets_with_options = []
-        for bet in bets:
-            options = fetchDBJson(
-                Template(
-                    "select option_id, latest_odds, option_status, option from bet_options where bet = $bet"
-                ).safe_substitute({"bet": bet["bet_id"]})
-            )
-            bet_with_option = bet
-            bet_with_option["bet_options"] = options
-            bets_with_options.append(bet_with_option)
-        return bets_with_options
+    if await is_admin(token["user"]):
+        return await fetch_bets_with_options()
     else:
         raise HTTPException(status_code=403, detail="You are not admin")
 
 
+# sort -> (order by, keyset condition for the next page)
+DICTIONARY_SORTS = {
+    "newest": ("word_id desc", "word_id < :before_id"),
+    "oldest": ("word_id asc", "word_id > :before_id"),
+    "frequency_desc": (
+        "coalesce(frequency, 0) desc, word_id desc",
+        "(coalesce(frequency, 0), word_id) < (:before_frequency, :before_id)",
+    ),
+    "frequency_asc": (
+        "coalesce(frequency, 0) asc, word_id asc",
+        "(coalesce(frequency, 0), word_id) > (:before_frequency, :before_id)",
+    ),
+}
+
+
+def escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
 @api_router.get("/api/dictionary")
-async def get_dictionary(token: str = Depends(authUtils.validate_access_token)):
-    res = fetchDBJson("select * from dictionary order by word_id DESC")
-    return res
+async def get_dictionary(
+    q: Optional[str] = None,
+    submitter: Optional[str] = None,
+    sort: str = Query("newest", regex="^(newest|oldest|frequency_desc|frequency_asc)$"),
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before_id: Optional[int] = None,
+    before_frequency: Optional[int] = None,
+    token: str = Depends(authUtils.validate_access_token),
+):
+    # Words matching q by prefix, fuzzily (trigram similarity) or anywhere in
+    # the description, see migrations/005_dictionary_search.sql for the indexes.
+    # Paging is keyset based: pass word_id (and frequency when sorting by it)
+    # of the last word seen. Without a limit every match is returned.
+    order_by, after_condition = DICTIONARY_SORTS[sort]
+    conditions = []
+    values = {}
+    if q and q.strip():
+        conditions.append(
+            "(word ilike :prefix or word % :q or description ilike :contains)"
+        )
+        values["q"] = q.strip()
+        values["prefix"] = escape_like(q.strip()) + "%"
+        values["contains"] = "%" + escape_like(q.strip()) + "%"
+    if submitter:
+        conditions.append("lower(submitter) = lower(:submitter)")
+        values["submitter"] = submitter
+    if before_id is not None:
+        if sort.startswith("frequency"):
+            if before_frequency is None:
+                raise HTTPException(
+                    status_code=422,
+                    detail="before_frequency is required when sorting by frequency",
+                )
+            values["before_frequency"] = before_frequency
+        conditions.append(after_condition)
+        values["before_id"] = before_id
+
+    query = "select * from dictionary"
+    if conditions:
+        query += " where " + " and ".join(conditions)
+    query += f" order by {order_by}"
+    if limit is not None:
+        query += " limit :limit"
+        values["limit"] = limit
+    return FastJSONResponse(await fetchDBJson(query, values))
+
+
+@api_router.get("/api/dictionary/submitters")
+async def get_dictionary_submitters(
+    token: str = Depends(authUtils.validate_access_token),
+):
+    res = await fetchDB(
+        "select distinct lower(submitter) from dictionary where submitter is not null order by 1"
+    )
+    return [row[0] for row in res]
 
 
 @api_router.get("/api/competition")
 async def get_dictionary(token: str = Depends(authUtils.validate_access_token)):
-    res = fetchDBJson(
+    res = await fetchDBJson(
         "select username, registered from users left join competition on users.user_id = competition.user_id"
     )
     return res
@@ -204,19 +214,15 @@ async def add_to_dictionary(
     payload: dict, token: str = Depends(authUtils.validate_access_token)
 ):
     try:
-        cursor = connection.cursor()
-        query = Template(
-            "insert into dictionary(frequency, description, submitter, word) values ($frequency, '$description', '$submitter', '$word')"
-        ).safe_substitute(
+        await insertDB(
+            "insert into dictionary(frequency, description, submitter, word) values (:frequency, :description, :submitter, :word)",
             {
                 "frequency": payload["frequency"],
                 "description": payload["description"],
                 "submitter": token["user"],
                 "word": payload["word"],
-            }
+            },
         )
-        cursor.execute(query)
-        connection.commit()
         return {"submitWord": True}
     except Exception as e:
         raise HTTPException(status_code=403, detail="Something went wrong")
@@ -228,23 +234,19 @@ async def update_dictionary(
 ):
     print(payload)
     try:
-        if token["user"].lower() == payload["submitter"].lower() or is_admin(
+        if token["user"].lower() == payload["submitter"].lower() or await is_admin(
             token["user"]
         ):
             if isinstance(payload["frequency"], int):
-                cursor = connection.cursor()
-                query = Template(
-                    "update dictionary set word='$word', frequency=$frequency, description='$description' where word_id=$word_id;"
-                ).safe_substitute(
+                await insertDB(
+                    "update dictionary set word=:word, frequency=:frequency, description=:description where word_id=:word_id",
                     {
                         "word": payload["word"],
                         "frequency": payload["frequency"],
                         "description": payload["description"],
-                        "word_id": payload["word_id"],
-                    }
+                        "word_id": int(payload["word_id"]),
+                    },
                 )
-                cursor.execute(query)
-                connection.commit()
                 return {"updatedWord": True}
             else:
                 raise HTTPException(
@@ -263,12 +265,9 @@ async def delete_in_dictionary(
     word_id: str, token: str = Depends(authUtils.validate_access_token)
 ):
     try:
-        cursor = connection.cursor()
-        query = Template(
-            "delete from dictionary where word_id=$word_id"
-        ).safe_substitute({"word_id": word_id})
-        cursor.execute(query)
-        connection.commit()
+        await insertDB(
+            "delete from dictionary where word_id=:word_id", {"word_id": int(word_id)}
+        )
         return {"deleteWord": True}
     except Exception as e:
         raise HTTPException(status_code=403, detail="Could not delete word")
@@ -279,88 +278,117 @@ async def update_comp(
     payload: dict, token: str = Depends(authUtils.validate_access_token)
 ):
     try:
-        cursor = connection.cursor()
-        query = Template(
-            "insert into competition (user_id, registered) values ($user_id, $registered) on conflict (user_id) do update set user_id = excluded.user_id, registered = excluded.registered"
-        ).safe_substitute(
-            {"user_id": token["user_id"], "registered": payload["registered"]}
+        await insertDB(
+            "insert into competition (user_id, registered) values (:user_id, :registered) on conflict (user_id) do update set user_id = excluded.user_id, registered = excluded.registered",
+            {"user_id": token["user_id"], "registered": payload["registered"]},
         )
-        cursor.execute(query)
-        connection.commit()
         return {"submitWord": True}
     except Exception as e:
         raise HTTPException(status_code=403, detail="Something went wrong")
 
 
-@api_router.get("/api/accums")
-async def get_accums(token: str = Depends(authUtils.validate_access_token)):
-    accums = fetchDBJson(
-        Template(
-            "select accum_id, stake, total_odds, username, placed_timestamp from accums left join users on accums.user_id = users.user_id where accums.user_id = $user_id order by placed_timestamp DESC"
-        ).safe_substitute({"user_id": token["user_id"]})
-    )
-    accums_with_options = []
-    for accum in accums:
-        accum = accum
-        accum_options = fetchDBJson(
-            Template(
-                "select bets.title, accum_options.user_odds, bet_options.option, bet_options.option_status from bet_options natural join accum_options left join bets on bet_options.bet = bets.bet_id inner join accums on accum_options.accum_id = accums.accum_id where accums.accum_id = $accum_id"
-            ).safe_substitute({"accum_id": accum["accum_id"]})
-        )
+ACCUM_FEED_PAGE_SIZE = 50
 
-        accum["accumBets"] = accum_options
-        accums_with_options.append(accum)
-    return accums_with_options
 
+async def fetch_accums_with_bets(
+    condition="true",
+    values=None,
+    limit=None,
+    before_timestamp=None,
+    before_id=None,
+):
+    # Fetches a page of accums newest first, then all their legs in one batched query.
+    # Paging is keyset based: pass placed_timestamp and accum_id of the last accum seen.
+    values = dict(values or {})
+    if before_timestamp is not None and before_id is not None:
+        condition += " and (accums.placed_timestamp, accums.accum_id) < (:before_timestamp, :before_id)"
+        values["before_timestamp"] = before_timestamp
+        values["before_id"] = before_id
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = " limit :limit"
+        values["limit"] = limit
+
+    accums = await fetchDBJson(
+        f"select accum_id, stake, total_odds, username, placed_timestamp from accums left join users on accums.user_id = users.user_id where {condition} order by placed_timestamp DESC, accum_id DESC{limit_clause}",
+        values,
+    )
+    if not accums:
+        return accums
 
-@api_router.get("/api/useraccums/")
-async def get_accums(user, token: str = Depends(authUtils.validate_access_token)):
-    accums = fetchDBJson(
-        Template(
-            "select accum_id, stake, total_odds, username, placed_timestamp from accums left join users on accums.user_id = users.user_id where users.username = '$user' order by placed_timestamp DESC"
-        ).safe_substitute({"user": user})
+    accum_bets = defaultdict(list)
+    accum_options = await fetchDBJson(
+        "select accum_options.accum_id, bets.title, accum_options.user_odds, bet_options.option, bet_options.option_status from accum_options inner join bet_options on accum_options.option_id = bet_options.option_id left join bets on bet_options.bet = bets.bet_id where accum_options.accum_id = any(:accum_ids)",
+        {"accum_ids": [accum["accum_id"] for accum in accums]},
     )
-    accums_with_options = []
+    for accum_option in accum_options:
+        accum_bets[accum_option.pop("accum_id")].append(accum_option)
+
     for accum in accums:
-        accum = accum
-        accum_options = fetchDBJson(
-            Template(
-                "select bets.title, accum_options.user_odds, bet_options.option, bet_options.option_status from bet_options natural join accum_options left join bets on bet_options.bet = bets.bet_id inner join accums on accum_options.accum_id = accums.accum_id where accums.accum_id = $accum_id"
-            ).safe_substitute({"accum_id": accum["accum_id"]})
+        accum["accumBets"] = accum_bets[accum["accum_id"]]
+    return accums
+
+
+@api_router.get("/api/accums")
+async def get_accums(
+    limit: Optional[int] = Query(None, ge=1),
+    before_timestamp: Optional[datetime.datetime] = None,
+    before_id: Optional[int] = None,
+    token: str = Depends(authUtils.validate_access_token),
+):
+    return FastJSONResponse(
+        await fetch_accums_with_bets(
+            "accums.user_id = :user_id",
+            {"user_id": token["user_id"]},
+            limit,
+            before_timestamp,
+            before_id,
         )
+    )
 
-        accum["accumBets"] = accum_options
-        accums_with_options.append(accum)
-    return accums_with_options
+
+@api_router.get("/api/useraccums/")
+async def get_accums(
+    user,
+    limit: Optional[int] = Query(None, ge=1),
+    before_timestamp: Optional[datetime.datetime] = None,
+    before_id: Optional[int] = None,
+    token: str = Depends(authUtils.validate_access_token),
+):
+    return FastJSONResponse(
+        await fetch_accums_with_bets(
+            "users.username = :user", {"user": user}, limit, before_timestamp, before_id
+        )
+    )
 
 
 @api_router.get("/api/publicuserdata/")
 async def get_accums(user, token: str = Depends(authUtils.validate_access_token)):
-    data = fetchDBJson(
-        Template(
-            "select balance, firstname, lastname, last_login from users where username = '$user'"
-        ).safe_substitute({"user": user})
-    )
-    return data
+    user_data = await userCache.get(user)
+    if not user_data:
+        return []
+    return [
+        {
+            "balance": user_data["balance"],
+            "firstname": user_data["firstname"],
+            "lastname": user_data["lastname"],
+            "last_login": user_data["last_login"],
+        }
+    ]
 
 
 @api_router.get("/api/allaccums")
-async def get_accums(token: str = Depends(authUtils.validate_access_token)):
-    accums = fetchDBJson(
-        "select accum_id, stake, total_odds, username, placed_timestamp from accums left join users on accums.user_id = users.user_id order by placed_timestamp DESC"
-    )
-    accums_with_options = []
-    for accum in accums:
-        accum = accum
-        accum_options = fetchDBJson(
-            Template(
-                "select bets.title, accum_options.user_odds, bet_options.option, bet_options.option_status from bet_options natural join accum_options left join bets on bet_options.bet = bets.bet_id inner join accums on accum_options.accum_id = accums.accum_id where accums.accum_id = $accum_id"
-            ).safe_substitute({"accum_id": accum["accum_id"]})
+async def get_accums(
+    limit: int = Query(ACCUM_FEED_PAGE_SIZE, ge=1, le=500),
+    before_timestamp: Optional[datetime.datetime] = None,
+    before_id: Optional[int] = None,
+    token: str = Depends(authUtils.validate_access_token),
+):
+    return FastJSONResponse(
+        await fetch_accums_with_bets(
+            limit=limit, before_timestamp=before_timestamp, before_id=before_id
         )
-
-        accum["accumBets"] = accum_options
-        accums_with_options.append(accum)
-    return accums_with_options
+    )
 
 
 # @api_router.get("/admin/allaccums")
@@ -370,7 +398,10 @@ async def get_accums(token: str = Depends(authUtils.validate_access_token)):
 
 @api_router.get("/api/userAvailability/{user}")
 async def user_availability(user: str):
-    res = fetchDB(f"select exists(select 1 from users where username = '{user}')")
+    res = await fetchDB(
+        "select exists(select 1 from users where username = :username)",
+        {"username": user},
+    )
     if res[0][0]:
         return {"userTaken": True}
     else:
@@ -379,10 +410,9 @@ async def user_availability(user: str):
 
 @api_router.get("/api/login/")
 async def login(user, password):
-    user_pass = fetchDB(
-        Template(
-            "select user_id, password from users where username = '$username'"
-        ).safe_substitute({"username": user})
+    user_pass = await fetchDB(
+        "select user_id, password from users where username = :username",
+        {"username": user},
     )
     try:
         user_id = user_pass[0][0]
@@ -390,14 +420,13 @@ async def login(user, password):
 
     except IndexError:
         return {"loggedIn": False}
-    if bcrypt.checkpw(password.encode("utf-8"), user_pass.encode("utf-8")):
+    if await authUtils.verify_password(password, user_pass):
         jwt = await authUtils.create_access_token(user, user_id)
-        update_last_login = Template(
-            "update users set last_login = NOW() where user_id = $user_id"
-        ).safe_substitute({"user_id": user_id})
-        cursor = connection.cursor()
-        cursor.execute(update_last_login)
-        connection.commit()
+        await insertDB(
+            "update users set last_login = NOW() where user_id = :user_id",
+            {"user_id": user_id},
+        )
+        userCache.invalidate(username=user, user_id=user_id)
         return {"loggedIn": True, "jwt": jwt}
     else:
         return {"loggedIn": False}
@@ -407,28 +436,27 @@ async def login(user, password):
 async def add_user(
     token: str = Depends(authUtils.validate_access_token_nowhitelist),
 ):
-    res = fetchDBJson(
-        Template(
-            "select username, balance, firstname, lastname, admin, created_on from users where username = '$username'"
-        ).safe_substitute({"username": token["user"]})
+    user = await userCache.get(token["user"])
+    details = {
+        "username": user["username"],
+        "balance": user["balance"],
+        "firstname": user["firstname"],
+        "lastname": user["lastname"],
+        "admin": user["admin"],
+        "created_on": user["created_on"],
+    }
+    await insertDB(
+        "update users set last_login = NOW(), number_of_logins = number_of_logins + 1 where user_id = :user_id",
+        {"user_id": token["user_id"]},
     )
-    update_last_login = Template(
-        "update users set last_login = NOW() where user_id = $user_id"
-    ).safe_substitute({"user_id": token["user_id"]})
-    cursor = connection.cursor()
-    cursor.execute(update_last_login)
-    inc_numb_logins = Template(
-        "update users set number_of_logins = number_of_logins + 1 where user_id = $user_id"
-    ).safe_substitute({"user_id": token["user_id"]})
-    cursor.execute(inc_numb_logins)
-    connection.commit()
-    return res[0]
+    userCache.invalidate(username=token["user"], user_id=token["user_id"])
+    return details
 
 
 @api_router.get("/api/admin/users")
 async def get_users(token: str = Depends(authUtils.validate_access_token)):
-    if is_admin(token["user"]):
-        res = fetchDBJson(
+    if await is_admin(token["user"]):
+        res = await fetchDBJson(
             "select user_id, username, balance, created_on, last_login, firstname, lastname, admin, whitelist, number_of_logins from users"
         )
         return res
@@ -436,6 +464,22 @@ async def get_users(token: str = Depends(authUtils.validate_access_token)):
         raise HTTPException(status_code=403, detail="You are not admin")
 
 
+@api_router.get("/api/admin/hashmetrics")
+async def get_hash_metrics(token: str = Depends(authUtils.validate_access_token)):
+    if await is_admin(token["user"]):
+        return passwordHasher.metrics()
+    else:
+        raise HTTPException(status_code=403, detail="You are not admin")
+
+
+@api_router.get("/api/admin/oddsmetrics")
+async def get_odds_metrics(token: str = Depends(authUtils.validate_access_token)):
+    if await is_admin(token["user"]):
+        return oddsSnapshot.metrics()
+    else:
+        raise HTTPException(status_code=403, detail="You are not admin")
+
+
 # {category: "string", title: "string", options: [{latest_odds: number, option: "string"}]}
 @api_router.post("/api/admin/createbet")
 async def create_bet(bet: dict, token: str = Depends(authUtils.validate_access_token)):
@@ -446,34 +490,29 @@ async def create_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
     # close_date = parser.parse(bet["close_date"]).replace(
     #     tzinfo=ZoneInfo("Europe/Berlin")
     # )
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         # create bet
-        cursor = connection.cursor()
-        query1 = Template(
-            "insert into bets(category, title, is_accepted, submitter, close_timestamp) values ('$category', '$title', true, '$submitter', '$close_date') RETURNING bet_id"
-        ).safe_substitute(
-            {
-                "category": bet["category"],
-                "title": bet["title"],
-                "submitter": token["user"],
-                "close_date": close_date,
-            }
-        )
-        cursor.execute(query1)
-        id_of_bet = cursor.fetchone()[0]
-
-        for option in bet["options"]:
-            query2 = Template(
-                "insert into bet_options(latest_odds, option, bet) values ($latest_odds, '$option', $bet)"
-            ).safe_substitute(
+        async with database.transaction():
+            id_of_bet = await insertDB(
+                "insert into bets(category, title, is_accepted, submitter, close_timestamp) values (:category, :title, true, :submitter, :close_date) RETURNING bet_id",
                 {
-                    "latest_odds": float(option["latest_odds"]),
-                    "option": option["option"],
-                    "bet": id_of_bet,
-                }
+                    "category": bet["category"],
+                    "title": bet["title"],
+                    "submitter": token["user"],
+                    "close_date": close_date,
+                },
             )
-            cursor.execute(query2)
-        connection.commit()
+
+            for option in bet["options"]:
+                await insertDB(
+                    "insert into bet_options(latest_odds, option, bet) values (:latest_odds, :option, :bet)",
+                    {
+                        "latest_odds": float(option["latest_odds"]),
+                        "option": option["option"],
+                        "bet": id_of_bet,
+                    },
+                )
+        oddsSnapshot.invalidate()
         return {"settleBet": True}
     else:
         # TODO:
@@ -484,14 +523,13 @@ async def create_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
 
 @api_router.post("/api/admin/acceptbet")
 async def accept_bet(bet: dict, token: str = Depends(authUtils.validate_access_token)):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         try:
-            cursor = connection.cursor()
-            query = Template(
-                "update bets set is_accepted = true where bet_id = $bet_id"
-            ).safe_substitute({"bet_id": bet["bet_id"]})
-            cursor.execute(query)
-            connection.commit()
+            await insertDB(
+                "update bets set is_accepted = true where bet_id = :bet_id",
+                {"bet_id": int(bet["bet_id"])},
+            )
+            oddsSnapshot.invalidate()
             return {"closeBet": True}
         except Exception as e:
             raise HTTPException(status_code=403, detail="Something went wrong")
@@ -501,20 +539,17 @@ async def accept_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
 async def accept_bet(
     option: dict, token: str = Depends(authUtils.validate_access_token)
 ):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         try:
-            cursor = connection.cursor()
-            query = Template(
-                "update bet_options set option = '$option', latest_odds = $latest_odds where option_id = $option_id"
-            ).safe_substitute(
+            await insertDB(
+                "update bet_options set option = :option, latest_odds = :latest_odds where option_id = :option_id",
                 {
                     "option": option["option"],
-                    "latest_odds": option["latest_odds"],
-                    "option_id": option["option_id"],
-                }
+                    "latest_odds": float(option["latest_odds"]),
+                    "option_id": int(option["option_id"]),
+                },
             )
-            cursor.execute(query)
-            connection.commit()
+            oddsSnapshot.invalidate()
             return {"updateOption": True}
         except Exception as e:
             print(e)
@@ -525,20 +560,17 @@ async def accept_bet(
 async def accept_bet(
     option: dict, token: str = Depends(authUtils.validate_access_token)
 ):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         try:
-            cursor = connection.cursor()
-            query = Template(
-                "insert into bet_options(latest_odds, option, bet) values ($latest_odds, '$option', $bet)"
-            ).safe_substitute(
+            await insertDB(
+                "insert into bet_options(latest_odds, option, bet) values (:latest_odds, :option, :bet)",
                 {
-                    "latest_odds": option["latest_odds"],
+                    "latest_odds": float(option["latest_odds"]),
                     "option": option["option"],
-                    "bet": option["bet"],
-                }
+                    "bet": int(option["bet"]),
+                },
             )
-            cursor.execute(query)
-            connection.commit()
+            oddsSnapshot.invalidate()
             return {"addOption": True}
         except Exception as e:
             print(e)
@@ -549,16 +581,16 @@ async def accept_bet(
 async def accept_bet(
     payload: dict, token: str = Depends(authUtils.validate_access_token)
 ):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         try:
-            cursor = connection.cursor()
-            query = Template(
-                "update users set whitelist = $whitelisted where user_id = $user_id"
-            ).safe_substitute(
-                {"whitelisted": payload["whitelisted"], "user_id": payload["user_id"]}
+            await insertDB(
+                "update users set whitelist = :whitelisted where user_id = :user_id",
+                {
+                    "whitelisted": bool(payload["whitelisted"]),
+                    "user_id": int(payload["user_id"]),
+                },
             )
-            cursor.execute(query)
-            connection.commit()
+            userCache.invalidate(user_id=payload["user_id"])
             return {"updateWhitelist": True}
         except Exception as e:
             raise HTTPException(status_code=403, detail="Something went wrong")
@@ -566,14 +598,13 @@ async def accept_bet(
 
 @api_router.post("/api/admin/closebet")
 async def accept_bet(bet: dict, token: str = Depends(authUtils.validate_access_token)):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
         try:
-            cursor = connection.cursor()
-            query = Template(
-                "update bets set closed_early = NOW() where bet_id = $bet_id"
-            ).safe_substitute({"bet_id": bet["bet_id"]})
-            cursor.execute(query)
-            connection.commit()
+            await insertDB(
+                "update bets set closed_early = NOW() where bet_id = :bet_id",
+                {"bet_id": int(bet["bet_id"])},
+            )
+            oddsSnapshot.invalidate()
             return {"acceptBet": True}
         except Exception as e:
             raise HTTPException(status_code=403, detail="Something went wrong")
@@ -583,20 +614,17 @@ async def accept_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
 async def reset_password(
     payload: dict, token: str = Depends(authUtils.validate_access_token)
 ):
-    if is_admin(token["user"]):
+    if await is_admin(token["user"]):
+        hashed = await authUtils.create_hashed_password(payload["new_password"])
         try:
-            hashed = bcrypt.hashpw(
-                bytes(payload["new_password"], encoding="utf-8"), bcrypt.gensalt()
-            )
-
-            update_password = Template(
-                "update users set password = '$password' where user_id = $user_id"
-            ).safe_substitute(
-                {"password": hashed.decode("utf-8"), "user_id": payload["user_id"]}
+            await insertDB(
+                "update users set password = :password where user_id = :user_id",
+                {
+                    "password": hashed,
+                    "user_id": int(payload["user_id"]),
+                },
             )
-            cursor = connection.cursor()
-            cursor.execute(update_password)
-            connection.commit()
+            userCache.invalidate(user_id=payload["user_id"])
             return {"updatePassword": True}
         except Exception as e:
             return HTTPException(
@@ -608,19 +636,13 @@ async def reset_password(
 async def reset_password(
     payload: dict, token: str = Depends(authUtils.validate_access_token_nowhitelist)
 ):
+    hashed = await authUtils.create_hashed_password(payload["new_password"])
     try:
-        hashed = bcrypt.hashpw(
-            bytes(payload["new_password"], encoding="utf-8"), bcrypt.gensalt()
-        )
-
-        update_password = Template(
-            "update users set password = '$password' where user_id = $user_id"
-        ).safe_substitute(
-            {"password": hashed.decode("utf-8"), "user_id": token["user_id"]}
+        await insertDB(
+            "update users set password = :password where user_id = :user_id",
+            {"password": hashed, "user_id": token["user_id"]},
         )
-        cursor = connection.cursor()
-        cursor.execute(update_password)
-        connection.commit()
+        userCache.invalidate(username=token["user"], user_id=token["user_id"])
         return {"updatePassword": True}
     except Exception as e:
         return HTTPException(
@@ -639,105 +661,39 @@ async def create_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
         #     tzinfo=ZoneInfo("Europe/Berlin")
         # )
         # create bet
-        cursor = connection.cursor()
-        query1 = Template(
-            "insert into bets(category, title, submitter, close_timestamp) values ('$category', '$title', '$submitter', '$close_date') RETURNING bet_id"
-        ).safe_substitute(
-            {
-                "category": bet["category"],
-                "title": bet["title"],
-                "submitter": token["user"],
-                "close_date": close_date,
-            }
-        )
-        cursor.execute(query1)
-        id_of_bet = cursor.fetchone()[0]
-
-        for option in bet["options"]:
-            query2 = Template(
-                "insert into bet_options(latest_odds, option, bet) values ($latest_odds, '$option', $bet)"
-            ).safe_substitute(
+        async with database.transaction():
+            id_of_bet = await insertDB(
+                "insert into bets(category, title, submitter, close_timestamp) values (:category, :title, :submitter, :close_date) RETURNING bet_id",
                 {
-                    "latest_odds": float(option["latest_odds"]),
-                    "option": option["option"],
-                    "bet": id_of_bet,
-                }
+                    "category": bet["category"],
+                    "title": bet["title"],
+                    "submitter": token["user"],
+                    "close_date": close_date,
+                },
             )
-            cursor.execute(query2)
-        connection.commit()
+
+            for option in bet["options"]:
+                await insertDB(
+                    "insert into bet_options(latest_odds, option, bet) values (:latest_odds, :option, :bet)",
+                    {
+                        "latest_odds": float(option["latest_odds"]),
+                        "option": option["option"],
+                        "bet": id_of_bet,
+                    },
+                )
         return {"requestBet": True}
-    except error as e:
+    except Exception as e:
         # raise HTTPException(status_code=403, detail="You are not admin")
-        return {"requestBet": False, "errorMsg": e}
+        return {"requestBet": False, "errorMsg": str(e)}
 
 
 @api_router.post("/api/admin/settlebet")
 async def settle_bet(bet: dict, token: str = Depends(authUtils.validate_access_token)):
-    if is_admin(token["user"]):
-        # settle bet
-        cursor = connection.cursor()
-        query1 = Template(
-            "update bets set bet_status = 2 where bet_id = $bet_id"
-        ).safe_substitute(
-            {
-                "bet_id": bet["bet_id"],
-            }
-        )
-        cursor.execute(query1)
-        for option in bet["bet_options"]:
-            query2 = Template(
-                "update bet_options set option_status = $option_status where option_id = $option_id"
-            ).safe_substitute(
-                {
-                    "option_status": option["option_status"],
-                    "option_id": option["option_id"],
-                }
-            )
-            cursor.execute(query2)
-        query_accum_ids = Template(
-            "select distinct accum_id from accums natural join accum_options natural join bet_options where bet = $bet_id"
-        ).safe_substitute(
-            {
-                "bet_id": bet["bet_id"],
-            }
-        )
-        accum_ids = fetchDBJson(query_accum_ids)
-        for accum in accum_ids:
-            accum_id = accum["accum_id"]
-            query_accum = Template(
-                "select option_status, stake, total_odds, user_id from accum_options left join bet_options on accum_options.option_id = bet_options.option_id left join accums on accum_options.accum_id = accums.accum_id where accums.accum_id = $accum_id"
-            ).safe_substitute(
-                {
-                    "accum_id": accum_id,
-                }
-            )
-            accum = fetchDBJson(query_accum)
-            bet_went_in = True
-            for option in accum:
-                if option["option_status"] != 2:
-                    bet_went_in = False
-                    break
-            if bet_went_in:
-                user_id = accum[0]["user_id"]
-                pay_out_sum = accum[0]["stake"] * accum[0]["total_odds"]
-                query_update_balance = Template(
-                    "update users set balance = balance + $pay_out_sum where user_id = $user_id"
-                ).safe_substitute(
-                    {
-                        "pay_out_sum": pay_out_sum,
-                        "user_id": user_id,
-                    }
-                )
-                cursor.execute(query_update_balance)
-                query_set_paid_out = Template(
-                    "update accums set paid_out = true where accum_id = $accum_id"
-                ).safe_substitute(
-                    {
-                        "accum_id": accum_id,
-                    }
-                )
-                cursor.execute(query_set_paid_out)
-        connection.commit()
+    if await is_admin(token["user"]):
+        paid_user_ids = await settle_market(int(bet["bet_id"]), bet["bet_options"])
+        oddsSnapshot.invalidate()
+        for user_id in paid_user_ids:
+            userCache.invalidate(user_id=user_id)
         return {"settleBet": True}
     else:
         # TODO:
@@ -746,51 +702,77 @@ async def settle_bet(bet: dict, token: str = Depends(authUtils.validate_access_t
         return {"settleBet": False, "errorMsg": "Du er ikke admin"}
 
 
+PLACE_BET_QUERY = f"""
+    with open_legs as (
+        select legs.option_id, legs.user_odds
+        from unnest(CAST(:option_ids AS int[]), CAST(:user_odds AS numeric[]))
+            as legs(option_id, user_odds)
+        join bet_options on bet_options.option_id = legs.option_id
+        join bets on bets.bet_id = bet_options.bet
+        where {OPEN_BETS_CONDITION}
+    ),
+    debit as (
+        update users set balance = balance - CAST(:stake AS numeric)
+        where user_id = :user_id and balance >= CAST(:stake AS numeric)
+        and (select count(*) from open_legs) = :num_legs
+        returning user_id
+    ),
+    new_accum as (
+        insert into accums(stake, total_odds, user_id)
+        select CAST(:stake AS numeric), CAST(:total_odds AS numeric), user_id from debit
+        returning accum_id
+    ),
+    new_legs as (
+        insert into accum_options(option_id, accum_id, user_odds)
+        select open_legs.option_id, new_accum.accum_id, open_legs.user_odds
+        from new_accum cross join open_legs
+    ),
+    stats as (
+        insert into user_stats(user_id, total_accums, total_staked)
+        select user_id, 1, CAST(:stake AS numeric) from debit
+        on conflict (user_id) do update set
+            total_accums = user_stats.total_accums + 1,
+            total_staked = user_stats.total_staked + excluded.total_staked
+    )
+    select (select accum_id from new_accum) as accum_id,
+        (select count(*) from open_legs) as open_legs
+"""
+
+
 @api_router.post("/api/placebet")
 async def place_bet(bet: dict, token: str = Depends(authUtils.validate_access_token)):
-    res = fetchDBJson(
-        Template(
-            "select balance from users where username = '$username'"
-        ).safe_substitute({"username": token["user"]})
+    # One statement: the legs must all be on open bets and the balance must
+    # cover the stake, checked and debited atomically so concurrent bets
+    # can never spend the same money twice
+    stake = float(bet["stake"])
+    if stake <= 0:
+        return {"placeBet": False, "errorMsg": "Innsatsen må være større enn 0"}
+    legs = [option["option"] for option in bet["bets"]]
+    if not legs:
+        return {"placeBet": False, "errorMsg": "Kupongen har ingen valg"}
+
+    res = await fetchOneDBJson(
+        PLACE_BET_QUERY,
+        {
+            "option_ids": [int(leg["option_id"]) for leg in legs],
+            "user_odds": [float(leg["latest_odds"]) for leg in legs],
+            "num_legs": len(legs),
+            "stake": stake,
+            "total_odds": float(bet["totalodds"]),
+            "user_id": int(token["user_id"]),
+        },
     )
-    # TODO add check if closetime is in future and closed_early is none
-
-    if res[0]["balance"] >= bet["totalodds"]:
-        cursor = connection.cursor()
-        query1 = Template(
-            "insert into accums(stake, total_odds, user_id) values ($stake, $total_odds, $user_id) RETURNING accum_id"
-        ).safe_substitute(
-            {
-                "stake": float(bet["stake"]),
-                "total_odds": float(bet["totalodds"]),
-                "user_id": int(token["user_id"]),
+    if res["accum_id"] is None:
+        if res["open_legs"] != len(legs):
+            return {
+                "placeBet": False,
+                "errorMsg": "Ett eller flere av spillene er stengt",
             }
-        )
-        cursor.execute(query1)
-        id_of_new_accum = cursor.fetchone()[0]
-        for option in bet["bets"]:
-            query = Template(
-                "insert into accum_options(option_id, accum_id, user_odds) values ($option_id, $accum_id, $user_odds)"
-            ).safe_substitute(
-                {
-                    "option_id": option["option"]["option_id"],
-                    "accum_id": id_of_new_accum,
-                    "user_odds": option["option"]["latest_odds"],
-                }
-            )
-            cursor.execute(query)
-        balance_query = Template(
-            "update users set balance = balance - $stake where user_id = $user_id"
-        ).safe_substitute(
-            {"stake": float(bet["stake"]), "user_id": int(token["user_id"])}
-        )
-        cursor.execute(balance_query)
-        connection.commit()
-    else:
         return {
             "placeBet": False,
             "errorMsg": "Ikke nok penger på konto. Feil? Snakk med Lau",
         }
+    userCache.invalidate(username=token["user"], user_id=token["user_id"])
 
     return {"placeBet": True}
 
@@ -804,7 +786,7 @@ class UserCreate(BaseModel):
 
 @api_router.post("/api/createUser")
 async def add_user(user: UserCreate):
-    hashed = bcrypt.hashpw(bytes(user.password, encoding="utf-8"), bcrypt.gensalt())
+    hashed = await authUtils.create_hashed_password(user.password)
     try:
 
         query = (
@@ -813,12 +795,13 @@ async def add_user(user: UserCreate):
         )
         values = {
             "username": user.username,
-            "password": hashed.decode("utf-8"),
+            "password": hashed,
             "firstname": user.firstname,
             "lastname": user.lastname,
         }
 
         await database.execute(query, values)
+        userCache.invalidate(username=user.username)
         return {"userCreated": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -828,20 +811,13 @@ async def add_user(user: UserCreate):
 async def update_password(
     payload: dict, token: str = Depends(authUtils.validate_access_token)
 ):
-    # hashed = authUtils.create_hashed_password(user["password"])
+    hashed = await authUtils.create_hashed_password(payload["password"])
     try:
-        hashed = bcrypt.hashpw(
-            bytes(payload["password"], encoding="utf-8"), bcrypt.gensalt()
-        )
-
-        update_password = Template(
-            "update users set password = $password where user_id = $user_id"
-        ).safe_substitute(
-            {"password": hashed.decode("utf-8"), "user_id": int(token["user_id"])}
+        await insertDB(
+            "update users set password = :password where user_id = :user_id",
+            {"password": hashed, "user_id": int(token["user_id"])},
         )
-        cursor = connection.cursor()
-        cursor.execute(update_password)
-        connection.commit()
+        userCache.invalidate(username=token["user"], user_id=token["user_id"])
     except Exception as e:
         return HTTPException(
             status_code=500, detail="Something wrong. Could not update password"
@@ -5,30 +5,13 @@ from jose import jwt
 from jose.exceptions import JOSEError
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-import bcrypt
 from credentials import Credentials
-import psycopg2
-from postgresPool import pool
-from string import Template
-from psycopg2.extras import RealDictCursor
-
+from hash_utils import passwordHasher
+from user_cache import userCache
 
 SECRET = Credentials.secret
 ALGORITHM = Credentials.algorithm
 
-try:
-    connection = pool.getconn()
-
-except (Exception, psycopg2.DatabaseError) as error:
-    print("Error while connecting to PostgreSQL", error)
-
-
-def fetchDBJson(query):
-    cursor = connection.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(query)
-    result = cursor.fetchall()
-    return result
-
 
 class AuthUtils:
     """Token needs to implement exp date"""
@@ -38,11 +21,10 @@ class AuthUtils:
         self.JWT_SECRET_KEY = SECRET
 
     async def create_hashed_password(self, password: str) -> str:
-        bcrypt.hashpw(bytes(password, encoding="utf-8"), bcrypt.gensalt())
-        return self.password_context.hash(password)
+        return await passwordHasher.hash(password)
 
     async def verify_password(self, password: str, user_pass: str) -> bool:
-        verified = bcrypt.checkpw(password.encode("utf-8"), user_pass.encode("utf-8"))
+        verified = await passwordHasher.verify(password, user_pass)
         if verified:
             return True
         else:
@@ -63,12 +45,8 @@ class AuthUtils:
                 token, self.JWT_SECRET_KEY, algorithms=[self.JWT_ALGORITHM]
             )
 
-            res = fetchDBJson(
-                Template(
-                    "select whitelist from users where username = '$username'"
-                ).safe_substitute({"username": payload["user"]})
-            )
-            if res[0]["whitelist"]:
+            user = await userCache.get(payload["user"])
+            if user and user["whitelist"]:
                 return payload
             else:
                 raise HTTPException(status_code=403, detail="You are not whitelisted")
@@ -1,12 +1,22 @@
 from collections import defaultdict
+import asyncio
+import json
+import time
 from math import ceil
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from datetime import datetime, timedelta
 
 from db_instance import database
+from db_utils import gatherDB
+from stats_cache import StatsCache, statsCache
+from game_results import store_game_results
+from game_hub import GameHub
+from fast_json import FastJSONResponse
+from http_cache import etag_matches
 
-bb_router = APIRouter()
+bb_router = APIRouter(default_response_class=FastJSONResponse)
 
 ## BONDEBRIDGE
 
@@ -17,13 +27,6 @@ class UserCreate(BaseModel):
     nickname: str
 
 
-class GameCreate(BaseModel):
-    money_multiplier: int
-    extra_cost_loser: int
-    extra_cost_second_last: int
-    players: List[int]
-
-
 class PlayerScoreCreate(BaseModel):
     player_scores_id: Optional[int] = None
     game_player_id: Optional[int] = None
@@ -44,6 +47,35 @@ class RoundsCreate(BaseModel):
     rounds: List[RoundCreate]
 
 
+class PlayerScoreDelta(BaseModel):
+    player_scores_id: int
+    num_tricks: Optional[int] = None
+    stand: Optional[bool] = None
+
+
+class PlayerTotalsDelta(BaseModel):
+    game_player_id: int
+    score: int
+    warnings: int
+    bleedings: int
+
+
+class GameDelta(BaseModel):
+    # The game version the changes were made against, see PATCH /game/{game_id}
+    version: int
+    player_scores: List[PlayerScoreDelta] = []
+    players: List[PlayerTotalsDelta] = []
+
+
+class GameCreate(BaseModel):
+    money_multiplier: int
+    extra_cost_loser: int
+    extra_cost_second_last: int
+    players: List[int]
+    # Optional round schedule, created in the same transaction as the game
+    rounds: Optional[List[RoundCreate]] = None
+
+
 @bb_router.post("/adduser")
 async def add_player(player: dict):
     check_query = "SELECT COUNT(*) FROM bonde_users WHERE nickname = :nickname"
@@ -59,62 +91,126 @@ async def add_player(player: dict):
     return {"addUser": True}
 
 
+GAMES_PAGE_SIZE = 10  # Number of games to fetch per page
+GAMES_COUNT_TTL = 60  # Seconds before the cached total number of games is recounted
+
+games_count = {"count": None, "counted_at": 0.0}
+
+
+async def get_games_count():
+    # The total only feeds the page count, so it is recounted at most once per TTL
+    # and bumped by create_game in between
+    if (
+        games_count["count"] is None
+        or time.monotonic() - games_count["counted_at"] > GAMES_COUNT_TTL
+    ):
+        result = await database.fetch_one("SELECT COUNT(*) FROM games;")
+        games_count["count"] = result[0]
+        games_count["counted_at"] = time.monotonic()
+    return games_count["count"]
+
+
 @bb_router.get("/games")
-async def get_games(page: int = Query(1, ge=1)):
-    page_size = 10  # Number of games to fetch per page
+async def get_games(
+    page: int = Query(1, ge=1),
+    before_game_id: Optional[int] = Query(None, ge=1),
+):
+    # Pass the game_id of the last game seen as before_game_id to fetch the next page.
+    # page is only used when no cursor is given, deep pages should use the cursor.
     try:
-        total_games_query = "SELECT COUNT(*) FROM games;"
-        total_games_result = await database.fetch_one(total_games_query)
-        total_games = total_games_result[0]
-        total_pages = ceil(total_games / page_size)
-
-        games_query = """
-            SELECT * FROM games
-            ORDER BY game_id DESC
-            LIMIT :limit OFFSET :offset;
+        total_games = await get_games_count()
+        total_pages = ceil(total_games / GAMES_PAGE_SIZE)
+
+        if before_game_id is not None:
+            page_query = "SELECT * FROM games WHERE game_id < :before_game_id ORDER BY game_id DESC LIMIT :limit"
+            values = {"limit": GAMES_PAGE_SIZE, "before_game_id": before_game_id}
+        else:
+            page_query = (
+                "SELECT * FROM games ORDER BY game_id DESC LIMIT :limit OFFSET :offset"
+            )
+            values = {"limit": GAMES_PAGE_SIZE, "offset": (page - 1) * GAMES_PAGE_SIZE}
+
+        games_query = f"""
+            SELECT g.*, COALESCE(p.players, '[]') AS players
+            FROM ({page_query}) g
+            LEFT JOIN LATERAL (
+                SELECT json_agg(
+                    json_build_object('nickname', nickname, 'score', score)
+                    ORDER BY game_player_id
+                ) AS players
+                FROM game_players
+                LEFT JOIN bonde_users ON game_players.player_id = bonde_users.player_id
+                WHERE game_players.game_id = g.game_id
+            ) p ON TRUE
+            ORDER BY g.game_id DESC;
         """
-        games = await database.fetch_all(
-            games_query, {"limit": page_size, "offset": (page - 1) * page_size}
-        )
+        games = await database.fetch_all(games_query, values)
     except Exception as e:
         print("Error fetching games:", str(e))
         raise HTTPException(
             status_code=500, detail="An error occurred while fetching games"
         )
 
-    # Initialize the list of games with players
     games_with_players = []
-
     for game in games:
-        players_query = """
-            SELECT game_players.player_id, game_player_id, nickname, score
-            FROM games
-            NATURAL JOIN game_players
-            LEFT JOIN bonde_users ON game_players.player_id = bonde_users.player_id
-            WHERE game_id = :game_id;
-        """
-        try:
-            players_result = await database.fetch_all(
-                players_query, {"game_id": game["game_id"]}
-            )
-        except Exception as e:
-            print(f"Error fetching players for game_id {game['game_id']}:", str(e))
-            raise HTTPException(
-                status_code=500, detail="An error occurred while fetching players"
-            )
-
         game_with_players = dict(game)
-        game_with_players["players"] = [
-            {"nickname": player["nickname"], "score": player["score"]}
-            for player in players_result
-        ]
+        if isinstance(game_with_players["players"], str):
+            game_with_players["players"] = json.loads(game_with_players["players"])
         games_with_players.append(game_with_players)
 
-    return {"games": games_with_players, "totalPages": total_pages}
+    return {
+        "games": games_with_players,
+        "totalPages": total_pages,
+        "nextBeforeGameId": (
+            games_with_players[-1]["game_id"]
+            if len(games_with_players) == GAMES_PAGE_SIZE
+            else None
+        ),
+    }
 
 
-@bb_router.get("/game/{game_id}")
-async def get_game(game_id: int):
+def game_etag(game_id: int, version: int) -> str:
+    # Weak, the body may be sent gzip encoded or not
+    return f'W/"game-{game_id}-v{version}"'
+
+
+async def bump_game_version(
+    game_id: Optional[int] = None,
+    player_scores_ids: Optional[List[int]] = None,
+    game_player_ids: Optional[List[int]] = None,
+):
+    # Every write to a game, its rounds, scores or players bumps games.version,
+    # which is what the game ETag is derived from. Returns the game_id and
+    # status of every bumped game.
+    if game_id is not None:
+        query = "UPDATE games SET version = version + 1 WHERE game_id = :game_id RETURNING game_id, status"
+        values = {"game_id": game_id}
+    elif player_scores_ids:
+        query = """
+            UPDATE games SET version = version + 1
+            WHERE game_id IN (
+                SELECT rounds.game_id FROM player_scores
+                JOIN rounds ON player_scores.round_id = rounds.round_id
+                WHERE player_scores.player_scores_id = ANY(:ids)
+            )
+            RETURNING game_id, status
+        """
+        values = {"ids": player_scores_ids}
+    elif game_player_ids:
+        query = """
+            UPDATE games SET version = version + 1
+            WHERE game_id IN (
+                SELECT game_id FROM game_players WHERE game_player_id = ANY(:ids)
+            )
+            RETURNING game_id, status
+        """
+        values = {"ids": game_player_ids}
+    else:
+        return []
+    return await database.fetch_all(query, values)
+
+
+async def fetch_game(game_id: int):
     game_query = "SELECT * FROM games WHERE game_id = :game_id;"
     try:
         game = await database.fetch_one(game_query, {"game_id": game_id})
@@ -125,39 +221,55 @@ async def get_game(game_id: int):
         )
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
-
-    rounds_query = "SELECT round_id, num_cards, dealer_index, locked FROM rounds WHERE game_id = :game_id;"
+    return game
+
+
+async def load_game(game_id: int, game=None):
+    # The full game as served by GET /game/{game_id}
+    if game is None:
+        game = await fetch_game(game_id)
+
+    # Rounds and their scores in one query, grouped per round below
+    rounds_query = """
+        SELECT r.round_id, r.num_cards, r.dealer_index, r.locked,
+            ps.player_scores_id, ps.num_tricks, ps.stand
+        FROM rounds r
+        LEFT JOIN player_scores ps ON ps.round_id = r.round_id
+        WHERE r.game_id = :game_id
+        ORDER BY r.round_id ASC, ps.player_scores_id ASC;
+    """
     try:
-        rounds = await database.fetch_all(rounds_query, {"game_id": game_id})
+        round_rows = await database.fetch_all(rounds_query, {"game_id": game_id})
     except Exception as e:
         print(f"Error fetching rounds for game_id {game_id}:", str(e))
         raise HTTPException(
             status_code=500, detail="An error occurred while fetching rounds"
         )
 
-    rounds_with_scores = []
-    for round in rounds:
-        round_dict = dict(round)
-        round_scores_query = "SELECT player_scores_id, num_tricks, stand FROM player_scores WHERE round_id = :round_id ORDER BY player_scores_id ASC;"
-        try:
-            round_scores = await database.fetch_all(
-                round_scores_query, {"round_id": round["round_id"]}
-            )
-            round_dict["player_scores"] = round_scores
-            rounds_with_scores.append(round_dict)
-        except Exception as e:
-            print(
-                f"Error fetching player scores for round_id {round['round_id']}:",
-                str(e),
-            )
-            raise HTTPException(
-                status_code=500, detail="An error occurred while fetching player scores"
+    rounds_with_scores = dict()  # Format {round_id: round with player_scores}
+    for row in round_rows:
+        round_dict = rounds_with_scores.get(row["round_id"])
+        if round_dict is None:
+            round_dict = {
+                "round_id": row["round_id"],
+                "num_cards": row["num_cards"],
+                "dealer_index": row["dealer_index"],
+                "locked": row["locked"],
+                "player_scores": [],
+            }
+            rounds_with_scores[row["round_id"]] = round_dict
+        if row["player_scores_id"] is not None:
+            round_dict["player_scores"].append(
+                {
+                    "player_scores_id": row["player_scores_id"],
+                    "num_tricks": row["num_tricks"],
+                    "stand": row["stand"],
+                }
             )
 
     players_query = """
         SELECT nickname, bleedings, warnings, score, game_player_id, game_players.player_id
-        FROM games
-        NATURAL JOIN game_players
+        FROM game_players
         LEFT JOIN bonde_users ON game_players.player_id = bonde_users.player_id
         WHERE game_id = :game_id ORDER BY game_player_id ASC;
     """
@@ -168,7 +280,69 @@ async def get_game(game_id: int):
         raise HTTPException(
             status_code=500, detail="An error occurred while fetching players"
         )
-    return {"game": game, "rounds": rounds_with_scores, "players": players}
+    return {
+        "game": game,
+        "rounds": list(rounds_with_scores.values()),
+        "players": players,
+    }
+
+
+@bb_router.get("/game/{game_id}")
+async def get_game(game_id: int, request: Request):
+    game = await fetch_game(game_id)
+
+    etag = game_etag(game_id, game["version"])
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return FastJSONResponse(await load_game(game_id, game), headers={"ETag": etag})
+
+
+gameHub = GameHub(load_game)
+
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@bb_router.get("/game/{game_id}/events")
+async def game_events(game_id: int, request: Request):
+    # Server-sent events with the full game, once on connect and then after
+    # every change. The event id is the game version, so a reconnecting
+    # EventSource that already has the current version gets no resend.
+    queue = gameHub.subscribe(game_id)
+    try:
+        snapshot = await gameHub.snapshot(game_id)
+    except Exception:
+        gameHub.unsubscribe(game_id, queue)
+        raise
+
+    async def events():
+        try:
+            if request.headers.get("last-event-id") != str(snapshot[0]):
+                yield f"id: {snapshot[0]}\nevent: game\ndata: {snapshot[1]}\n\n"
+            while True:
+                try:
+                    version, data = await asyncio.wait_for(
+                        queue.get(), SSE_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"id: {version}\nevent: game\ndata: {data}\n\n"
+        finally:
+            gameHub.unsubscribe(game_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bb_router.get("/events/metrics")
+async def get_game_events_metrics():
+    return gameHub.metrics()
 
 
 @bb_router.get("/users")
@@ -185,35 +359,112 @@ async def get_users():
     return {"users": users}
 
 
+async def insert_rounds(
+    game_id: int, game_player_ids: List[int], rounds: List[RoundCreate]
+):
+    # Inserts all rounds and a player_scores row per player per round in one
+    # statement. Serial ids follow insertion order, so sorting by round_id
+    # gives the rounds back in schedule order. Returns (round_ids,
+    # player_scores_ids) with one list of ids per round, ordered like
+    # game_player_ids. Run it inside a transaction.
+    query = """
+        WITH new_rounds AS (
+            INSERT INTO rounds(game_id, num_cards, dealer_index)
+            SELECT :game_id, r.num_cards, r.dealer_index
+            FROM unnest(CAST(:num_cards AS int[]), CAST(:dealer_indexes AS int[]))
+                WITH ORDINALITY AS r(num_cards, dealer_index, position)
+            ORDER BY r.position
+            RETURNING round_id
+        ),
+        new_scores AS (
+            INSERT INTO player_scores(round_id, game_player_id)
+            SELECT new_rounds.round_id, seats.game_player_id
+            FROM new_rounds
+            CROSS JOIN unnest(CAST(:game_player_ids AS int[])) AS seats(game_player_id)
+            RETURNING player_scores_id, round_id, game_player_id
+        )
+        SELECT new_rounds.round_id, new_scores.game_player_id, new_scores.player_scores_id
+        FROM new_rounds
+        LEFT JOIN new_scores ON new_scores.round_id = new_rounds.round_id
+        ORDER BY new_rounds.round_id, new_scores.player_scores_id
+    """
+    rows = await database.fetch_all(
+        query,
+        {
+            "game_id": game_id,
+            "num_cards": [round.num_cards for round in rounds],
+            "dealer_indexes": [round.dealer_index for round in rounds],
+            "game_player_ids": game_player_ids,
+        },
+    )
+
+    scores_by_round = dict()  # Format {round_id: {game_player_id: player_scores_id}}
+    for row in rows:
+        scores = scores_by_round.setdefault(row["round_id"], dict())
+        if row["player_scores_id"] is not None:
+            scores[row["game_player_id"]] = row["player_scores_id"]
+    if len(scores_by_round) != len(rounds):
+        raise HTTPException(
+            status_code=500, detail="Failed to retrieve the created round IDs"
+        )
+
+    round_ids = list(scores_by_round)
+    player_scores_ids = [
+        [scores[game_player_id] for game_player_id in game_player_ids]
+        for scores in scores_by_round.values()
+    ]
+    return round_ids, player_scores_ids
+
+
 @bb_router.post("/game")
 async def create_game(game: GameCreate):
     try:
-        query1 = """
-            INSERT INTO games(money_multiplier, extra_cost_loser, extra_cost_second_last)
-            VALUES (:money_multiplier, :extra_cost_loser, :extra_cost_second_last)
-            RETURNING game_id;
-        """
-        game_id = await database.execute(
-            query1,
-            {
-                "money_multiplier": game.money_multiplier,
-                "extra_cost_loser": game.extra_cost_loser,
-                "extra_cost_second_last": game.extra_cost_second_last,
-            },
-        )
-
-        game_player_ids = []
-        # Add players to game_players table
-        for player_id in game.players:
-            query2 = """
+        # The game and its whole roster in one statement, game_player_ids come
+        # back in the order of game.players
+        query = """
+            WITH new_game AS (
+                INSERT INTO games(money_multiplier, extra_cost_loser, extra_cost_second_last)
+                VALUES (:money_multiplier, :extra_cost_loser, :extra_cost_second_last)
+                RETURNING game_id
+            ),
+            new_players AS (
                 INSERT INTO game_players(game_id, player_id)
-                VALUES (:game_id, :player_id)
-                RETURNING game_player_id;
-            """
-            game_player_id = await database.execute(
-                query2, {"game_id": game_id, "player_id": player_id}
+                SELECT new_game.game_id, roster.player_id
+                FROM new_game
+                CROSS JOIN unnest(CAST(:players AS int[]))
+                    WITH ORDINALITY AS roster(player_id, seat)
+                ORDER BY roster.seat
+                RETURNING game_player_id
             )
-            game_player_ids.append(game_player_id)
+            SELECT new_game.game_id, new_players.game_player_id
+            FROM new_game
+            LEFT JOIN new_players ON true
+            ORDER BY new_players.game_player_id
+        """
+        async with database.transaction():
+            rows = await database.fetch_all(
+                query,
+                {
+                    "money_multiplier": game.money_multiplier,
+                    "extra_cost_loser": game.extra_cost_loser,
+                    "extra_cost_second_last": game.extra_cost_second_last,
+                    "players": game.players,
+                },
+            )
+            game_id = rows[0]["game_id"]
+            game_player_ids = [
+                row["game_player_id"]
+                for row in rows
+                if row["game_player_id"] is not None
+            ]
+
+            if game.rounds is not None:
+                round_ids, player_scores_ids = await insert_rounds(
+                    game_id, game_player_ids, game.rounds
+                )
+
+        if games_count["count"] is not None:
+            games_count["count"] += 1
 
     except Exception as e:
         print(f"Error creating game: {str(e)}")
@@ -221,65 +472,29 @@ async def create_game(game: GameCreate):
             status_code=500, detail="Something went wrong. Could not create game"
         )
 
+    if game.rounds is None:
+        return {
+            "game_id": game_id,
+            "game_player_ids": game_player_ids,
+        }
     return {
         "game_id": game_id,
         "game_player_ids": game_player_ids,
+        "created": True,
+        "round_ids": round_ids,
+        "player_scores_ids": player_scores_ids,
     }
 
 
 @bb_router.post("/rounds")
 async def create_rounds(rounds: RoundsCreate):
     try:
-        round_ids = []
-        player_scores_ids = []
-        game_id = rounds.game_id
-
-        # Add all rounds
-        for round in rounds.rounds:
-            query = """
-                INSERT INTO rounds(game_id, num_cards, dealer_index)
-                VALUES (:game_id, :num_cards, :dealer_index)
-                RETURNING round_id;
-            """
-            round_id_result = await database.fetch_one(
-                query,
-                {
-                    "game_id": game_id,
-                    "num_cards": round.num_cards,
-                    "dealer_index": round.dealer_index,
-                },
+        async with database.transaction():
+            round_ids, player_scores_ids = await insert_rounds(
+                rounds.game_id, rounds.game_player_ids, rounds.rounds
             )
-            if not round_id_result:
-                raise HTTPException(
-                    status_code=500, detail="Failed to retrieve the created round ID"
-                )
-
-            round_id = round_id_result["round_id"]
-            round_ids.append(round_id)
-
-            # Add all player scores for each round
-            scores_id_round = []
-            for game_player_id in rounds.game_player_ids:
-                query = """
-                    INSERT INTO player_scores(round_id, game_player_id)
-                    VALUES (:round_id, :game_player_id)
-                    RETURNING player_scores_id;
-                """
-                player_scores_id_result = await database.fetch_one(
-                    query,
-                    {
-                        "round_id": round_id,
-                        "game_player_id": game_player_id,
-                    },
-                )
-                if not player_scores_id_result:
-                    raise HTTPException(
-                        status_code=500,
-                        detail=f"Failed to add player score for round {round_id}",
-                    )
-                scores_id_round.append(player_scores_id_result["player_scores_id"])
-
-            player_scores_ids.append(scores_id_round)
+            await bump_game_version(game_id=rounds.game_id)
+        gameHub.publish(rounds.game_id)
 
     except Exception as e:
         print(f"Error creating rounds: {str(e)}")
@@ -297,22 +512,48 @@ async def create_rounds(rounds: RoundsCreate):
 @bb_router.put("/rounds")
 async def update_round(data: dict):
     try:
-        # Update player_scores
-        for round in data["rounds"]:
-            for player_score in round["player_scores"]:
-                query = """
-                    UPDATE player_scores
-                    SET num_tricks = :num_tricks, stand = :stand
-                    WHERE player_scores_id = :player_scores_id
-                """
-                await database.execute(
-                    query,
-                    {
-                        "num_tricks": player_score["num_tricks"],
-                        "stand": player_score["stand"],
-                        "player_scores_id": player_score["player_scores_id"],
-                    },
-                )
+        # The client sends every score of the game, keep the last one per id
+        player_scores = {
+            player_score["player_scores_id"]: player_score
+            for round in data["rounds"]
+            for player_score in round["player_scores"]
+        }
+        # One set-based update for all scores. Rows that did not change are
+        # skipped, so resending an unchanged game writes nothing.
+        query = """
+            UPDATE player_scores
+            SET num_tricks = v.num_tricks, stand = v.stand
+            FROM unnest(
+                CAST(:player_scores_ids AS int[]),
+                CAST(:num_tricks AS int[]),
+                CAST(:stands AS boolean[])
+            ) AS v(player_scores_id, num_tricks, stand)
+            WHERE player_scores.player_scores_id = v.player_scores_id
+            AND (player_scores.num_tricks, player_scores.stand)
+                IS DISTINCT FROM (v.num_tricks, v.stand)
+            RETURNING player_scores.player_scores_id
+        """
+        async with database.transaction():
+            updated = await database.fetch_all(
+                query,
+                {
+                    "player_scores_ids": list(player_scores),
+                    "num_tricks": [
+                        player_score["num_tricks"]
+                        for player_score in player_scores.values()
+                    ],
+                    "stands": [
+                        player_score["stand"] for player_score in player_scores.values()
+                    ],
+                },
+            )
+            games = await bump_game_version(
+                player_scores_ids=[row["player_scores_id"] for row in updated]
+            )
+        if any(game["status"] == "finished" for game in games):
+            statsCache.invalidate()
+        for game in games:
+            gameHub.publish(game["game_id"])
 
     except Exception as e:
         print(f"Error updating round: {str(e)}")
@@ -326,27 +567,56 @@ async def update_round(data: dict):
 @bb_router.put("/playerdata")
 async def update_player_scores(data: dict):
     try:
-        # Update player_scores
+        players = dict()  # Format {game_player_id: player}, last one wins
         for player in data["playerData"]:
-            try:
-                query = """
-                    UPDATE game_players
-                    SET score = :score,
-                    warnings = :warnings,
-                    bleedings = :bleedings
-                    WHERE game_player_id = :game_player_id
-                """
-                await database.execute(
-                    query,
-                    {
-                        "score": player["score"],
-                        "warnings": player["warnings"],
-                        "bleedings": player["bleedings"],
-                        "game_player_id": player["game_player_id"],
-                    },
-                )
-            except KeyError:
+            if not all(
+                key in player
+                for key in ("game_player_id", "score", "warnings", "bleedings")
+            ):
                 print("KeyError: One of the expected keys was not found in the data")
+                continue
+            players[player["game_player_id"]] = player
+
+        # One set-based update for all players, unchanged rows are skipped
+        query = """
+            UPDATE game_players
+            SET score = v.score, warnings = v.warnings, bleedings = v.bleedings
+            FROM unnest(
+                CAST(:game_player_ids AS int[]),
+                CAST(:scores AS int[]),
+                CAST(:warnings AS int[]),
+                CAST(:bleedings AS int[])
+            ) AS v(game_player_id, score, warnings, bleedings)
+            WHERE game_players.game_player_id = v.game_player_id
+            AND (game_players.score, game_players.warnings, game_players.bleedings)
+                IS DISTINCT FROM (v.score, v.warnings, v.bleedings)
+            RETURNING game_players.game_player_id
+        """
+        async with database.transaction():
+            updated = await database.fetch_all(
+                query,
+                {
+                    "game_player_ids": list(players),
+                    "scores": [player["score"] for player in players.values()],
+                    "warnings": [player["warnings"] for player in players.values()],
+                    "bleedings": [player["bleedings"] for player in players.values()],
+                },
+            )
+            games = await bump_game_version(
+                game_player_ids=[row["game_player_id"] for row in updated]
+            )
+
+            # Scores of a finished game changed, so its stored results and any
+            # cached stats are stale
+            finished_game_ids = [
+                game["game_id"] for game in games if game["status"] == "finished"
+            ]
+            if finished_game_ids:
+                await store_game_results(finished_game_ids)
+        if finished_game_ids:
+            statsCache.invalidate()
+        for game in games:
+            gameHub.publish(game["game_id"])
 
     except Exception as e:
         print(f"Error updating player scores: {str(e)}")
@@ -358,11 +628,126 @@ async def update_player_scores(data: dict):
     return {"message": "Player scores updated successfully"}
 
 
+@bb_router.patch("/game/{game_id}")
+async def update_game_delta(game_id: int, delta: GameDelta, response: Response):
+    # Applies only the changed score cells and player totals. The write is
+    # accepted only if the game is still at delta.version, otherwise someone
+    # else changed it first and the client gets 409 with the current version.
+    player_scores = {score.player_scores_id: score for score in delta.player_scores}
+    players = {player.game_player_id: player for player in delta.players}
+    try:
+        async with database.transaction():
+            game = await database.fetch_one(
+                """
+                UPDATE games SET version = version + 1
+                WHERE game_id = :game_id AND version = :version
+                RETURNING version, status
+                """,
+                {"game_id": game_id, "version": delta.version},
+            )
+            if not game:
+                current = await database.fetch_one(
+                    "SELECT version FROM games WHERE game_id = :game_id",
+                    {"game_id": game_id},
+                )
+                if not current:
+                    raise HTTPException(status_code=404, detail="Game not found")
+                raise HTTPException(
+                    status_code=409,
+                    detail={
+                        "message": "The game was changed by someone else",
+                        "version": current["version"],
+                    },
+                    headers={"ETag": game_etag(game_id, current["version"])},
+                )
+
+            if player_scores:
+                updated = await database.fetch_all(
+                    """
+                    UPDATE player_scores
+                    SET num_tricks = v.num_tricks, stand = v.stand
+                    FROM rounds, unnest(
+                        CAST(:player_scores_ids AS int[]),
+                        CAST(:num_tricks AS int[]),
+                        CAST(:stands AS boolean[])
+                    ) AS v(player_scores_id, num_tricks, stand)
+                    WHERE player_scores.player_scores_id = v.player_scores_id
+                    AND rounds.round_id = player_scores.round_id
+                    AND rounds.game_id = :game_id
+                    RETURNING player_scores.player_scores_id
+                    """,
+                    {
+                        "game_id": game_id,
+                        "player_scores_ids": list(player_scores),
+                        "num_tricks": [
+                            score.num_tricks for score in player_scores.values()
+                        ],
+                        "stands": [score.stand for score in player_scores.values()],
+                    },
+                )
+                if len(updated) != len(player_scores):
+                    raise HTTPException(
+                        status_code=400,
+                        detail="player_scores does not belong to this game",
+                    )
+
+            if players:
+                updated = await database.fetch_all(
+                    """
+                    UPDATE game_players
+                    SET score = v.score, warnings = v.warnings, bleedings = v.bleedings
+                    FROM unnest(
+                        CAST(:game_player_ids AS int[]),
+                        CAST(:scores AS int[]),
+                        CAST(:warnings AS int[]),
+                        CAST(:bleedings AS int[])
+                    ) AS v(game_player_id, score, warnings, bleedings)
+                    WHERE game_players.game_player_id = v.game_player_id
+                    AND game_players.game_id = :game_id
+                    RETURNING game_players.game_player_id
+                    """,
+                    {
+                        "game_id": game_id,
+                        "game_player_ids": list(players),
+                        "scores": [player.score for player in players.values()],
+                        "warnings": [player.warnings for player in players.values()],
+                        "bleedings": [player.bleedings for player in players.values()],
+                    },
+                )
+                if len(updated) != len(players):
+                    raise HTTPException(
+                        status_code=400, detail="players does not belong to this game"
+                    )
+
+                if game["status"] == "finished":
+                    await store_game_results([game_id])
+
+        if game["status"] == "finished":
+            statsCache.invalidate()
+        gameHub.publish(game_id)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error updating game with game_id {game_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail="Something went wrong. Could not update game"
+        )
+
+    response.headers["ETag"] = game_etag(game_id, game["version"])
+    return {"version": game["version"]}
+
+
 @bb_router.put("/game/complete/{game_id}")
 async def update_round(game_id: int):
     try:
-        query = "UPDATE games SET status = 'finished' WHERE game_id = :game_id"
-        await database.execute(query, {"game_id": game_id})
+        query = "UPDATE games SET status = 'finished', version = version + 1 WHERE game_id = :game_id RETURNING version"
+        async with database.transaction():
+            version = await database.execute(query, {"game_id": game_id})
+            # Settle the game once here instead of on every stats request
+            await store_game_results([game_id])
+        statsCache.invalidate()
+        gameHub.publish(game_id)
 
     except Exception as e:
         print(f"Error completing game with game_id {game_id}: {str(e)}")
@@ -370,7 +755,7 @@ async def update_round(game_id: int):
             status_code=500, detail="Something went wrong. Could not complete game"
         )
 
-    return {"message": "Game completed successfully"}
+    return {"message": "Game completed successfully", "version": version}
 
 
 ## STATISTICS
@@ -383,166 +768,61 @@ async def calc_player_earnings(
     to_date: Optional[datetime] = None,
 ):
     try:
-        # Build the initial query with possible date filtering
+        # Build the query with possible date filtering
         date_filter = ""
-        if from_date and to_date:
-            to_date_plus_one = to_date + timedelta(days=1)
-            date_filter = f" AND created_on >= '{from_date.strftime('%Y-%m-%d')}' AND created_on < '{to_date_plus_one.strftime('%Y-%m-%d')}'"
-        elif from_date:
-            date_filter = f" AND created_on >= '{from_date.strftime('%Y-%m-%d')}'"
-        elif to_date:
-            to_date_plus_one = to_date + timedelta(days=1)
-            date_filter = f" AND created_on < '{to_date_plus_one.strftime('%Y-%m-%d')}'"
-
-        game_ids_query = f"SELECT game_id, money_multiplier, extra_cost_loser, extra_cost_second_last FROM games WHERE status = 'finished'{date_filter}"
-
-        games = await database.fetch_all(game_ids_query)
-
-        player_earnings = dict()  # Format {1: -40, 2: 54, 3: 187 ...}
-        player_nicknames = dict()  # To store player_id to nickname mapping
-        player_games_count = (
-            dict()
-        )  # To store the number of games each player participated in
-
-        for game in games:
-            players_query = """
-                SELECT score, bonde_users.player_id, nickname, favorite
-                FROM game_players
-                LEFT JOIN bonde_users ON game_players.player_id = bonde_users.player_id
-                WHERE game_id = :game_id
+        values = {}
+        if from_date:
+            date_filter += " AND g.created_on >= :from_date"
+            values["from_date"] = from_date.date()
+        if to_date:
+            date_filter += " AND g.created_on < :to_date"
+            values["to_date"] = (to_date + timedelta(days=1)).date()
+
+        game_filter = ""
+        if onlyFavorite:
+            # Skip games where not all players are favorites
+            game_filter += """
+                AND NOT EXISTS (
+                    SELECT 1 FROM game_players fgp
+                    LEFT JOIN bonde_users fbu ON fgp.player_id = fbu.player_id
+                    WHERE fgp.game_id = g.game_id AND fbu.favorite IS NOT TRUE
+                )
             """
-            players = await database.fetch_all(
-                players_query, {"game_id": game["game_id"]}
-            )
-
-            # Update player_nicknames dictionary
-            for player in players:
-                player_nicknames[player["player_id"]] = player["nickname"]
-
-            if onlyFavorite:
-                if not all(player["favorite"] for player in players):
-                    continue  # Skip this game if not all players are favorites
-
-            player_ids_list = playerIds.split(",") if playerIds else None
-            game_player_ids = [str(player["player_id"]) for player in players]
-
-            if player_ids_list is None or set(player_ids_list) == set(game_player_ids):
-                # Sort players by scores
-                players.sort(key=lambda x: x["score"], reverse=True)
-
-                if len(players) < 4:
-                    continue
-                # Calculate earnings/losses
-                first_place, last_place = players[0], players[-1]
-                second_place, second_last_place = players[1], players[-2]
-
-                # Initialize earnings and losses
-                first_place_earnings = second_place_earnings = 0
-                last_place_earnings = second_last_earnings = 0
-
-                # Check for ties between first and second, and last and second last
-                if first_place["score"] == second_place["score"]:
-                    # If first and second place tie, split combined earnings
-                    total_earnings = (
-                        (first_place["score"] - last_place["score"])
-                        * game["money_multiplier"]
-                        + game["extra_cost_loser"]
-                    ) + (
-                        (second_place["score"] - second_last_place["score"])
-                        * game["money_multiplier"]
-                        + game["extra_cost_second_last"]
-                    )
-                    first_place_earnings = second_place_earnings = total_earnings / 2
-                else:
-                    # Calculate earnings for first and second places normally
-                    first_place_earnings = (
-                        first_place["score"] - last_place["score"]
-                    ) * game["money_multiplier"] + game["extra_cost_loser"]
-                    second_place_earnings = (
-                        second_place["score"] - second_last_place["score"]
-                    ) * game["money_multiplier"] + game["extra_cost_second_last"]
-
-                if last_place["score"] == second_last_place["score"]:
-                    # If last and second last tie, split the total losses
-                    total_loss = -(first_place_earnings + second_place_earnings)
-                    last_place_earnings = second_last_earnings = total_loss / 2
-                else:
-                    last_place_earnings = -first_place_earnings
-                    second_last_earnings = -second_place_earnings
-
-                # Special edge cases
-                if (
-                    first_place["score"]
-                    == second_place["score"]
-                    == second_last_place["score"]
-                    == last_place["score"]
-                ):
-                    first_place_earnings = second_place_earnings = (
-                        second_last_earnings
-                    ) = last_place_earnings = 0
-                elif (
-                    first_place["score"]
-                    == second_place["score"]
-                    == second_last_place["score"]
-                ):
-                    first_place_earnings = second_place_earnings = (
-                        second_last_earnings
-                    ) = (last_place_earnings / 3)
-                elif (
-                    second_place["score"]
-                    == second_last_place["score"]
-                    == last_place["score"]
-                ):
-                    second_place_earnings = second_last_earnings = (
-                        last_place_earnings
-                    ) = 0
-                if second_last_place["score"] == second_place["score"]:
-                    second_last_earnings = second_place_earnings = 0
-
-                # Update player_earnings and player_games_count
-                for player in players:
-                    player_id = player["player_id"]
-                    if player_id == first_place["player_id"]:
-                        earnings = first_place_earnings
-                    elif player_id == last_place["player_id"]:
-                        earnings = last_place_earnings
-                    elif player_id == second_place["player_id"]:
-                        earnings = second_place_earnings
-                    elif player_id == second_last_place["player_id"]:
-                        earnings = second_last_earnings
-                    else:
-                        earnings = 0  # For players not in first, second, last, or second last place
-
-                    if player_id in player_earnings:
-                        player_earnings[player_id] += earnings
-                        player_games_count[player_id] += 1
-                    else:
-                        player_earnings[player_id] = earnings
-                        player_games_count[player_id] = 1
-            else:
-                continue
-
-        # Calculate average earnings per game and round to one decimal place
-        avg_earnings = {
-            player_id: round(
-                player_earnings[player_id] / player_games_count[player_id], 1
-            )
-            for player_id in player_earnings
-        }
+        if playerIds:
+            # Only games played by exactly the selected players
+            player_ids = list({int(id) for id in playerIds.split(",")})
+            game_filter += """
+                AND g.game_id IN (
+                    SELECT game_id FROM game_players
+                    GROUP BY game_id
+                    HAVING bool_and(player_id = ANY(:player_ids))
+                    AND COUNT(DISTINCT player_id) = :num_player_ids
+                )
+            """
+            values["player_ids"] = player_ids
+            values["num_player_ids"] = len(player_ids)
+
+        # Earnings are settled and stored per game when it is completed, see game_results.py
+        earnings_query = f"""
+            SELECT bu.nickname, SUM(gr.earnings) AS total_earnings, COUNT(*) AS num_games
+            FROM game_results gr
+            JOIN games g ON gr.game_id = g.game_id
+            LEFT JOIN bonde_users bu ON gr.player_id = bu.player_id
+            WHERE g.status = 'finished'{date_filter}{game_filter}
+            GROUP BY gr.player_id, bu.nickname
+            ORDER BY total_earnings DESC
+        """
+        earnings = await database.fetch_all(earnings_query, values)
 
-        # Swap player_id with nickname
-        final_earnings = {
-            player_nicknames[player_id]: {
-                "total_earnings": earnings,
-                "num_games": player_games_count[player_id],
-                "avg_earnings": avg_earnings[player_id],
+        return {
+            row["nickname"]: {
+                "total_earnings": row["total_earnings"],
+                "num_games": row["num_games"],
+                "avg_earnings": round(row["total_earnings"] / row["num_games"], 1),
             }
-            for player_id, earnings in player_earnings.items()
-            if player_id in player_nicknames
+            for row in earnings
         }
 
-        return final_earnings
-
     except Exception as e:
         print(f"Error calculating player earnings: {str(e)}")
         raise HTTPException(
@@ -577,6 +857,40 @@ async def get_stats(
             status_code=400, detail="Invalid date format. Expected YYYY-MM-DD."
         )
 
+    try:
+        player_ids_key = (
+            tuple(sorted({int(id) for id in playerIds.split(",")})) if playerIds else ()
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid playerIds")
+    cache_key = (player_ids_key, exclusive, only_favorite, from_date, to_date)
+
+    stats = statsCache.get(cache_key)
+    if stats is StatsCache.MISS:
+        generation = statsCache.generation
+        stats = await compute_stats(
+            playerIds, exclusive, only_favorite, from_date_obj, to_date_obj
+        )
+        statsCache.set(cache_key, stats, generation)
+
+    if stats is None:
+        return Response(status_code=204)
+    return FastJSONResponse(stats)
+
+
+@bb_router.get("/stats/cache")
+async def get_stats_cache_metrics():
+    return statsCache.metrics()
+
+
+async def compute_stats(
+    playerIds: Optional[str],
+    exclusive: bool,
+    only_favorite: bool,
+    from_date_obj: Optional[datetime],
+    to_date_obj: Optional[datetime],
+):
+    # Returns the stats, or None when there is nothing to show
     # Fetching needed data from db
     try:
         base_query1 = """
@@ -607,33 +921,23 @@ async def get_stats(
         WHERE 
             ps.num_tricks IS NOT NULL
         """
-        base_query3 = """
+        # Per player aggression, overall (finished games) and when standing,
+        # computed from a single scan of the join with conditional aggregates
+        base_query34 = """
         SELECT
             bu.nickname,
             r.num_cards,
-            ROUND(AVG(ps.num_tricks), 1) AS avg_tricks,
-            COUNT(DISTINCT r.round_id) AS num_rounds
+            ROUND(AVG(ps.num_tricks) FILTER (WHERE g.status = 'finished'), 1) AS avg_tricks,
+            COUNT(*) FILTER (WHERE g.status = 'finished') AS finished_rows,
+            ROUND(AVG(ps.num_tricks) FILTER (WHERE ps.stand = TRUE), 1) AS avg_tricks_stand,
+            COUNT(*) FILTER (WHERE ps.stand = TRUE) AS stand_rows
         FROM
             player_scores ps
         LEFT JOIN rounds r ON ps.round_id = r.round_id
         LEFT JOIN game_players gp ON ps.game_player_id = gp.game_player_id
         LEFT JOIN bonde_users bu ON gp.player_id = bu.player_id
-        LEFT JOIN games g ON r.game_id = g.game_id 
-        WHERE g.status = 'finished'
-        """
-        base_query4 = """
-        SELECT
-            bu.nickname,
-            r.num_cards,
-            ROUND(AVG(ps.num_tricks), 1) AS avg_tricks,
-            COUNT(DISTINCT r.round_id) AS num_rounds
-        FROM
-            player_scores ps
-        LEFT JOIN rounds r ON ps.round_id = r.round_id
-        LEFT JOIN game_players gp ON ps.game_player_id = gp.game_player_id
-        LEFT JOIN bonde_users bu ON gp.player_id = bu.player_id
-        LEFT JOIN games g ON r.game_id = g.game_id 
-        WHERE ps.stand = TRUE
+        LEFT JOIN games g ON r.game_id = g.game_id
+        WHERE (g.status = 'finished' OR ps.stand = TRUE)
         """
 
         # Add only favorite filter if needed
@@ -641,8 +945,7 @@ async def get_stats(
             favorite_filter = "AND bu.favorite = TRUE "
             base_query1 += favorite_filter
             base_query2 += favorite_filter
-            base_query3 += favorite_filter
-            base_query4 += favorite_filter
+            base_query34 += favorite_filter
 
         # If playerIds are provided, filter results
         if playerIds:
@@ -660,10 +963,7 @@ async def get_stats(
                 player_condition += ")"
             base_query1 += player_condition
             base_query2 += player_condition
-            base_query3 += (
-                f" AND gp.player_id IN ({','.join([str(id) for id in ids_list])})"
-            )
-            base_query4 += (
+            base_query34 += (
                 f" AND gp.player_id IN ({','.join([str(id) for id in ids_list])})"
             )
 
@@ -671,24 +971,31 @@ async def get_stats(
         base_query2 += (
             " GROUP BY r.num_cards, ps.num_tricks ORDER BY r.num_cards, ps.num_tricks"
         )
-        base_query3 += " GROUP BY r.num_cards, bu.nickname"
-        base_query4 += " GROUP BY r.num_cards, bu.nickname"
-
-        # Execute the queries and get the results
-        result1 = await database.fetch_all(base_query1)
-        result2 = await database.fetch_all(base_query2)
-        result3 = await database.fetch_all(base_query3)
-        result4 = await database.fetch_all(base_query4)
+        base_query34 += " GROUP BY r.num_cards, bu.nickname"
 
-        if not result1 or not result2 or not result3 or not result4:
-            return Response(status_code=204)
+        bleedings_query = "select nickname, SUM(bleedings) as total_bleedings, SUM(warnings) as total_warnings from game_players left join bonde_users on game_players.player_id = bonde_users.player_id group by bonde_users.nickname order by total_bleedings DESC"
 
-        player_earnings = await calc_player_earnings(
-            playerIds, only_favorite, from_date_obj, to_date_obj
+        # The queries are independent, so run them at the same time on separate connections
+        result1, result2, result34, player_earnings, bleedings = await gatherDB(
+            database.fetch_all(base_query1),
+            database.fetch_all(base_query2),
+            database.fetch_all(base_query34),
+            calc_player_earnings(playerIds, only_favorite, from_date_obj, to_date_obj),
+            database.fetch_all(bleedings_query),
         )
+        result3 = [row for row in result34 if row["finished_rows"]]
+        result4 = [
+            {
+                "nickname": row["nickname"],
+                "num_cards": row["num_cards"],
+                "avg_tricks": row["avg_tricks_stand"],
+            }
+            for row in result34
+            if row["stand_rows"]
+        ]
 
-        bleedings_query = "select nickname, SUM(bleedings) as total_bleedings, SUM(warnings) as total_warnings from game_players left join bonde_users on game_players.player_id = bonde_users.player_id group by bonde_users.nickname order by total_bleedings DESC"
-        bleedings = await database.fetch_all(bleedings_query)
+        if not result1 or not result2 or not result3 or not result4:
+            return None
 
         if result1 and result2:
             num_underbid = 0
@@ -764,7 +1071,7 @@ async def get_stats(
                 "player_aggression_stand": player_aggression_stand,
             }
         else:
-            return Response(status_code=204)
+            return None
 
     except Exception as e:
         print(e)
@@ -1,6 +1,15 @@
+import os
 from databases import Database
 from credentials import Credentials
 
-DATABASE_URL = f"postgresql://{Credentials.user}:{Credentials.password}@{Credentials.host}/{Credentials.db}"
+# DATABASE_URL overrides the credentials, e.g. to point the benchmarks at a throwaway database
+DATABASE_URL = os.environ.get(
+    "DATABASE_URL",
+    f"postgresql://{Credentials.user}:{Credentials.password}@{Credentials.host}/{Credentials.db}",
+)
 
-database = Database(DATABASE_URL)
+# Pool sizing can be tuned per deployment without touching the code
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 5))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 20))
+
+database = Database(DATABASE_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
@@ -0,0 +1,38 @@
+import asyncio
+
+from db_instance import database
+from route_metrics import fresh_context
+
+# Async helpers used by both routers. Every call checks a connection out of the
+# pool owned by `database` for the current request task, so concurrent requests
+# no longer share (and block on) a single psycopg2 connection.
+# Queries use named parameters, e.g. "select * from users where user_id = :user_id".
+
+
+async def fetchDB(query, values=None):
+    rows = await database.fetch_all(query, values)
+    return [tuple(dict(row).values()) for row in rows]
+
+
+async def fetchDBJson(query, values=None):
+    rows = await database.fetch_all(query, values)
+    return [dict(row) for row in rows]
+
+
+async def fetchOneDBJson(query, values=None):
+    row = await database.fetch_one(query, values)
+    return dict(row) if row else None
+
+
+async def insertDB(query, values=None):
+    # Returns the first column of a RETURNING clause, if any
+    return await database.execute(query, values)
+
+
+async def gatherDB(*aws):
+    # Runs independent queries concurrently. Each one starts from an empty context,
+    # so it checks out its own pooled connection instead of sharing the request's.
+    # Their queries still count towards the request's metrics.
+    # Not for use inside a transaction.
+    tasks = [fresh_context().run(asyncio.ensure_future, aw) for aw in aws]
+    return await asyncio.gather(*tasks)
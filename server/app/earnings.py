@@ -0,0 +1,99 @@
+import numpy as np
+
+MIN_PLAYERS = 4
+
+
+def settle_games(rows):
+    """Settles the money of many finished games at once.
+
+    `rows` holds one entry per game player with game_id, money_multiplier,
+    extra_cost_loser, extra_cost_second_last and score, grouped by game.
+    Within a game, ties in score keep the row order, just like a stable sort
+    of each game's players would.
+
+    Returns three arrays over the players of every settled game, in game order
+    and by placement within a game: the index into `rows`, the earnings and
+    the placement (1 is first).
+    """
+    empty = (np.array([], int), np.array([], float), np.array([], int))
+    if not rows:
+        return empty
+
+    game_ids = np.array([row["game_id"] for row in rows])
+    scores = np.array([row["score"] for row in rows], dtype=float)
+
+    # Each game is a contiguous run of rows: starts[g] is its first row, counts[g] its size
+    starts = np.flatnonzero(np.r_[True, game_ids[1:] != game_ids[:-1]])
+    counts = np.diff(np.r_[starts, len(rows)])
+    game_of_row = np.repeat(np.arange(len(starts)), counts)
+    column_of_row = np.arange(len(rows)) - starts[game_of_row]
+
+    keep = counts >= MIN_PLAYERS
+    if not keep.any():
+        return empty
+
+    # Padded score matrix, one row per game, sorted by score with padding last
+    score_matrix = np.full((len(starts), counts.max()), -np.inf)
+    score_matrix[game_of_row, column_of_row] = scores
+    score_matrix, starts, counts = score_matrix[keep], starts[keep], counts[keep]
+    order = np.argsort(-score_matrix, axis=1, kind="stable")
+    sorted_rows = starts[:, None] + order
+    sorted_scores = np.take_along_axis(score_matrix, order, axis=1)
+
+    game_rows = starts  # any row of a game carries the game settings
+    multiplier = np.array([rows[i]["money_multiplier"] for i in game_rows], float)
+    extra_loser = np.array([rows[i]["extra_cost_loser"] for i in game_rows], float)
+    extra_second_last = np.array(
+        [rows[i]["extra_cost_second_last"] for i in game_rows], float
+    )
+
+    games = np.arange(len(starts))
+    first, second = sorted_scores[:, 0], sorted_scores[:, 1]
+    second_last = sorted_scores[games, counts - 2]
+    last = sorted_scores[games, counts - 1]
+
+    # Same tie rules as settling a single game, applied to every game at once
+    first_earnings = (first - last) * multiplier + extra_loser
+    second_earnings = (second - second_last) * multiplier + extra_second_last
+    top_tie = first == second
+    split_top = (first_earnings + second_earnings) / 2
+    first_earnings = np.where(top_tie, split_top, first_earnings)
+    second_earnings = np.where(top_tie, split_top, second_earnings)
+
+    bottom_tie = last == second_last
+    split_bottom = -(first_earnings + second_earnings) / 2
+    last_earnings = np.where(bottom_tie, split_bottom, -first_earnings)
+    second_last_earnings = np.where(bottom_tie, split_bottom, -second_earnings)
+
+    all_tied = top_tie & (second == second_last) & bottom_tie
+    top_three_tied = ~all_tied & top_tie & (second == second_last)
+    bottom_three_tied = (
+        ~all_tied & ~top_three_tied & (second == second_last) & bottom_tie
+    )
+    first_earnings = np.where(all_tied, 0, first_earnings)
+    last_earnings = np.where(all_tied | bottom_three_tied, 0, last_earnings)
+    top_three_split = last_earnings / 3
+    first_earnings = np.where(top_three_tied, top_three_split, first_earnings)
+    second_earnings = np.where(
+        all_tied | bottom_three_tied,
+        0,
+        np.where(top_three_tied, top_three_split, second_earnings),
+    )
+    second_last_earnings = np.where(
+        all_tied | bottom_three_tied,
+        0,
+        np.where(top_three_tied, top_three_split, second_last_earnings),
+    )
+    middle_tie = second_last == second
+    second_earnings = np.where(middle_tie, 0, second_earnings)
+    second_last_earnings = np.where(middle_tie, 0, second_last_earnings)
+
+    # Earnings per sorted position, everyone between second and second last gets 0
+    earnings_matrix = np.zeros(sorted_rows.shape)
+    earnings_matrix[:, 0] = first_earnings
+    earnings_matrix[:, 1] = second_earnings
+    earnings_matrix[games, counts - 2] = second_last_earnings
+    earnings_matrix[games, counts - 1] = last_earnings
+    positions = np.broadcast_to(np.arange(sorted_rows.shape[1]), sorted_rows.shape)
+    valid = positions < counts[:, None]
+    return sorted_rows[valid], earnings_matrix[valid], positions[valid] + 1
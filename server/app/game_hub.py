@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+
+from fast_json import dumps
+
+
+class GameHub:
+    """Fans out live updates of bondebridge games to their subscribers.
+
+    Writers call `publish(game_id)` after committing. If anyone watches the
+    game, its snapshot is loaded once with `loader` and handed to every
+    subscriber, so N watchers cost one read per change instead of N polls.
+    Changes that arrive while a snapshot is loading are coalesced into one
+    more load, and slow subscribers only ever get the latest snapshot.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader  # async game_id -> game dict
+        self.subscribers = dict()  # Format {game_id: set of asyncio.Queue}
+        self.snapshots = dict()  # Format {game_id: (version, json)}
+        self.loading = dict()  # Format {game_id: asyncio.Task}
+        self.dirty = set()
+        self.loads = 0
+        self.pushes = 0
+
+    def subscribe(self, game_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(game_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, game_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(game_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[game_id]
+            self.snapshots.pop(game_id, None)
+
+    async def snapshot(self, game_id: int):
+        """Returns (version, json) of the game, cached while it has watchers."""
+        cached = self.snapshots.get(game_id)
+        if cached is not None:
+            return cached
+        return await self._load(game_id)
+
+    def publish(self, game_id: int):
+        """Schedules a push of the game. Call it only after the write committed."""
+        if game_id not in self.subscribers:
+            return
+        if game_id in self.loading:
+            self.dirty.add(game_id)
+            return
+        # A fresh context, so the load gets its own pooled connection instead
+        # of the one (and maybe the transaction) of the request that published
+        self.loading[game_id] = contextvars.Context().run(
+            asyncio.ensure_future, self._push(game_id)
+        )
+
+    async def _load(self, game_id: int):
+        game = await self.loader(game_id)
+        self.loads += 1
+        snapshot = (game["game"]["version"], dumps(game).decode())
+        if game_id in self.subscribers:
+            self.snapshots[game_id] = snapshot
+        return snapshot
+
+    async def _push(self, game_id: int):
+        try:
+            while game_id in self.subscribers:
+                self.dirty.discard(game_id)
+                snapshot = await self._load(game_id)
+                for queue in self.subscribers.get(game_id, ()):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(snapshot)
+                    self.pushes += 1
+                if game_id not in self.dirty:
+                    break
+        except Exception as e:
+            print(f"Error pushing game with game_id {game_id}: {str(e)}")
+        finally:
+            del self.loading[game_id]
+
+    def metrics(self) -> dict:
+        return {
+            "games": len(self.subscribers),
+            "subscribers": sum(len(queues) for queues in self.subscribers.values()),
+            "loads": self.loads,
+            "pushes": self.pushes,
+        }
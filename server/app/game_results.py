@@ -0,0 +1,58 @@
+from typing import List, Optional
+
+from db_instance import database
+from earnings import settle_games
+
+
+async def store_game_results(game_ids: Optional[List[int]] = None):
+    """(Re)computes game_results for the given finished games, or all of them.
+
+    Games that are not finished, or have too few players to be settled, end
+    up without results.
+    """
+    game_filter = ""
+    values = {}
+    if game_ids is not None:
+        if not game_ids:
+            return
+        game_filter = " AND g.game_id = ANY(:game_ids)"
+        values["game_ids"] = list(game_ids)
+
+    rows = await database.fetch_all(
+        f"""
+        SELECT g.game_id, g.money_multiplier, g.extra_cost_loser, g.extra_cost_second_last,
+            gp.game_player_id, gp.score, gp.player_id
+        FROM games g
+        JOIN game_players gp ON gp.game_id = g.game_id
+        WHERE g.status = 'finished'{game_filter}
+        ORDER BY g.game_id, gp.game_player_id
+        """,
+        values,
+    )
+    flat_rows, earnings, placements = settle_games(rows)
+    results = [
+        {
+            "game_player_id": rows[i]["game_player_id"],
+            "game_id": rows[i]["game_id"],
+            "player_id": rows[i]["player_id"],
+            "placement": int(placement),
+            "earnings": float(earning),
+        }
+        for i, earning, placement in zip(flat_rows, earnings, placements)
+    ]
+
+    async with database.transaction():
+        if game_ids is None:
+            await database.execute("DELETE FROM game_results")
+        else:
+            await database.execute(
+                "DELETE FROM game_results WHERE game_id = ANY(:game_ids)", values
+            )
+        if results:
+            await database.execute_many(
+                """
+                INSERT INTO game_results(game_player_id, game_id, player_id, placement, earnings)
+                VALUES (:game_player_id, :game_id, :player_id, :placement, :earnings)
+                """,
+                results,
+            )
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so hashing never blocks the event loop.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism.
+    Requests beyond `max_queue` waiting jobs are rejected with 503 instead of
+    piling up behind a login storm.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="bcrypt"
+        )
+        self.pending = 0  # queued + running jobs
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_hash_seconds = 0.0
+        self.max_hash_seconds = 0.0
+        self.lock = threading.Lock()  # counters are touched by worker threads
+
+    async def _run(self, func, *args):
+        with self.lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy, please try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+        submitted = time.perf_counter()
+        future = self.executor.submit(self._timed, submitted, func, *args)
+        # The slot is freed when the job ends, not when the request awaiting it
+        # does: a cancelled request leaves its job queued or running
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future):
+        with self.lock:
+            self.pending -= 1
+
+    def _timed(self, submitted, func, *args):
+        started = time.perf_counter()
+        with self.lock:
+            self.running += 1
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_wait_seconds += started - submitted
+                self.total_hash_seconds += finished - started
+                self.max_hash_seconds = max(self.max_hash_seconds, finished - started)
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(
+            bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt()
+        )
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(
+            bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8")
+        )
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": max(self.pending - self.running, 0),
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": (
+                round(1000 * self.total_wait_seconds / self.completed, 2)
+                if self.completed
+                else 0
+            ),
+            "avg_hash_ms": (
+                round(1000 * self.total_hash_seconds / self.completed, 2)
+                if self.completed
+                else 0
+            ),
+            "max_hash_ms": round(1000 * self.max_hash_seconds, 2),
+        }
+
+
+passwordHasher = PasswordHasher(
+    max_workers=int(os.environ.get("BCRYPT_WORKERS", os.cpu_count() or 2)),
+    max_queue=int(os.environ.get("BCRYPT_MAX_QUEUE", 32)),
+)
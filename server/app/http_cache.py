@@ -0,0 +1,104 @@
+import hashlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag`.
+
+    If-None-Match uses the weak comparison, so W/ prefixes are ignored. The
+    header may list several tags separated by commas, and * matches any.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+class ETagMiddleware:
+    """Adds a weak content ETag to JSON GET responses and answers 304.
+
+    Responses are buffered and hashed only when they are 200, JSON and carry
+    no ETag of their own, so endpoints with version based ETags (games, open
+    bets) and streams (server-sent events) pass through untouched. A matching
+    If-None-Match gets a bodyless 304, saving the transfer, not the query.
+    The tag is weak because compression below may send the same content
+    gzip encoded or not, and a strong tag must differ between those.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        body = []
+
+        async def send_with_etag(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if (
+                    message["status"] == 200
+                    and "etag" not in headers
+                    and headers.get("content-type", "").startswith("application/json")
+                ):
+                    start = message
+                    return
+                await send(message)
+                return
+
+            if start is None:
+                await send(message)
+                return
+            body.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            content = b"".join(body)
+            etag = f'W/"{hashlib.sha256(content).hexdigest()[:32]}"'
+            headers = MutableHeaders(raw=start["headers"])
+            headers["ETag"] = etag
+            if "cache-control" not in headers:
+                # Lets browsers keep the body but revalidate it on every use
+                headers["Cache-Control"] = "private, no-cache"
+            if etag_matches(if_none_match, etag):
+                del headers["content-length"]
+                del headers["content-type"]
+                await send({**start, "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send(start)
+            await send({"type": "http.response.body", "body": content})
+
+        await self.app(scope, receive, send_with_etag)
+
+
+class CompressionMiddleware:
+    """gzip for responses above `minimum_size`, except server-sent events.
+
+    A compressed event stream would sit in the compressor's buffer instead
+    of reaching the watcher, so EventSource requests bypass compression.
+    """
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "text/event-stream" in Headers(scope=scope).get(
+            "accept", ""
+        ):
+            await self.app(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
@@ -1,9 +1,14 @@
+import os
+
 import uvicorn
 from fastapi import FastAPI
 from api import api_router
 from bondebridge import bb_router
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from http_cache import CompressionMiddleware, ETagMiddleware
+from route_metrics import MetricsMiddleware, routeMetrics
 
 from db_instance import database
 
@@ -14,6 +19,11 @@ app.include_router(bb_router, prefix="/api/bonde")
 
 origins = ["*"]
 
+# ETags are computed on the uncompressed body, compression wraps around them
+app.add_middleware(ETagMiddleware)
+app.add_middleware(
+    CompressionMiddleware, minimum_size=int(os.environ.get("GZIP_MIN_SIZE", 1000))
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +33,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency includes the other middleware
+routeMetrics.instrument(database)
+app.add_middleware(MetricsMiddleware, metrics=routeMetrics)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(
+        routeMetrics.render(), media_type="text/plain; version=0.0.4"
+    )
+
 
 @app.on_event("startup")
 async def startup():
@@ -0,0 +1,54 @@
+"""Maintenance commands for derived tables.
+
+python maintenance.py rebuild-leaderboard
+python maintenance.py backfill-game-results
+"""
+
+import asyncio
+import sys
+
+from db_instance import database
+from game_results import store_game_results
+
+
+async def rebuild_leaderboard():
+    # Recomputes every user's leaderboard counters from the accums table
+    async with database.transaction():
+        await database.execute("delete from user_stats")
+        await database.execute("""
+            insert into user_stats(user_id, total_accums, won_accums, total_staked, total_paid_out)
+            select
+                user_id,
+                count(*),
+                count(*) filter (where paid_out),
+                coalesce(sum(stake), 0),
+                coalesce(sum(stake * total_odds) filter (where paid_out), 0)
+            from accums
+            group by user_id
+            """)
+
+
+async def backfill_game_results():
+    # Recomputes the stored earnings and placements of every finished game
+    await store_game_results()
+
+
+COMMANDS = {
+    "rebuild-leaderboard": rebuild_leaderboard,
+    "backfill-game-results": backfill_game_results,
+}
+
+
+async def main(command):
+    await database.connect()
+    try:
+        await COMMANDS[command]()
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+        sys.exit(f"Usage: python maintenance.py [{'|'.join(COMMANDS)}]")
+    asyncio.run(main(sys.argv[1]))
+    print(f"{sys.argv[1]} done")
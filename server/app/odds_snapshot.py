@@ -0,0 +1,82 @@
+import asyncio
+import secrets
+import time
+from datetime import datetime
+
+from fast_json import dumps
+
+
+class OddsSnapshot:
+    """In-process snapshot of the open markets, served by /api/openbets.
+
+    Admin endpoints that change open bets or odds call `invalidate`, and the
+    next read rebuilds the snapshot with one query. It is also rebuilt when
+    the first of its bets closes, and after the TTL, which bounds staleness
+    against writes made by other processes. `version` only increases when the
+    content actually changed, so ETags stay valid across no-op rebuilds.
+    """
+
+    def __init__(self, loader, ttl: float):
+        self.loader = loader  # async () -> list of open bets
+        self.ttl = ttl
+        self.boot_id = secrets.token_hex(4)  # versions are only unique per process
+        self.version = 0
+        self.bets = None
+        self.body = None
+        self.etag = None
+        self.refresh_at = 0.0
+        self.closes_at = None
+        self.generation = 0  # bumped by invalidate
+        self.built_generation = -1  # generation the snapshot was built at
+        self.lock = asyncio.Lock()
+        self.hits = 0
+        self.rebuilds = 0
+
+    def invalidate(self):
+        self.generation += 1
+
+    def _is_fresh(self) -> bool:
+        if self.built_generation != self.generation:
+            return False
+        if time.monotonic() >= self.refresh_at:
+            return False
+        return (
+            self.closes_at is None
+            or datetime.now(self.closes_at.tzinfo) < self.closes_at
+        )
+
+    async def get(self):
+        """Returns (etag, json body) of the open bets, rebuilt first if needed."""
+        if self._is_fresh():
+            self.hits += 1
+            return self.etag, self.body
+        async with self.lock:
+            # Another request may have rebuilt it while we waited
+            if self._is_fresh():
+                self.hits += 1
+                return self.etag, self.body
+            generation = self.generation
+            bets = await self.loader()
+            body = dumps(bets)
+            self.rebuilds += 1
+            self.bets = bets
+            if body != self.body:
+                self.version += 1
+                self.body = body
+                # Weak, the body may be sent gzip encoded or not
+                self.etag = f'W/"odds-{self.boot_id}-v{self.version}"'
+            close_times = [
+                bet["close_timestamp"] for bet in bets if bet.get("close_timestamp")
+            ]
+            self.closes_at = min(close_times) if close_times else None
+            self.refresh_at = time.monotonic() + self.ttl
+            self.built_generation = generation
+        return self.etag, self.body
+
+    def metrics(self) -> dict:
+        return {
+            "version": self.version,
+            "bets": len(self.bets) if self.bets is not None else 0,
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+        }
@@ -0,0 +1,179 @@
+import contextvars
+import time
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # per bucket, made cumulative on render
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield str(bound), total
+        yield "+Inf", self.count
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# The stats of the request being served, None outside of requests
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def fresh_context() -> contextvars.Context:
+    """An empty context, except that queries run in it still count towards
+    the current request. For work the request spawns and waits for."""
+    context = contextvars.Context()
+    context.run(request_stats.set, request_stats.get())
+    return context
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RouteMetrics:
+    """Per-route request metrics in the Prometheus text format.
+
+    For every route template (not every URL, so /game/{game_id} is one
+    series) it keeps a histogram of latency, of the number of database
+    queries per request and of the time spent in them, plus a count per
+    status code. A jump in queries per request is what an N+1 regression
+    looks like. Counters live in the process, each worker reports its own.
+    """
+
+    def __init__(self):
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_seconds = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.statuses = defaultdict(int)
+
+    def instrument(self, database):
+        # Wraps the pool's query methods so every statement is timed and
+        # counted towards the request that sent it. Safe to call again.
+        if getattr(database, "instrumented", False):
+            return
+        database.instrumented = True
+        for name in ("execute", "execute_many", "fetch_all", "fetch_one", "fetch_val"):
+            method = getattr(database, name)
+
+            async def timed(*args, _method=method, **kwargs):
+                stats = request_stats.get()
+                if stats is None:
+                    return await _method(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await _method(*args, **kwargs)
+                finally:
+                    stats.queries += 1
+                    stats.db_seconds += time.perf_counter() - start
+
+            setattr(database, name, timed)
+
+    def record(self, method, route, status, latency, stats):
+        key = (method, route)
+        self.latency[key].observe(latency)
+        self.queries[key].observe(stats.queries)
+        self.db_seconds[key].observe(stats.db_seconds)
+        self.statuses[(method, route, status)] += 1
+
+    def render(self) -> str:
+        lines = []
+
+        def histogram(name, description, series):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), values in sorted(series.items()):
+                labels = f'method="{method}",route="{escape_label(route)}"'
+                for bound, count in values.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {values.sum}")
+                lines.append(f"{name}_count{{{labels}}} {values.count}")
+
+        histogram(
+            "http_request_duration_seconds",
+            "Time until the response started.",
+            self.latency,
+        )
+        histogram(
+            "http_request_db_queries",
+            "Database queries sent per request.",
+            self.queries,
+        )
+        histogram(
+            "http_request_db_seconds",
+            "Time spent waiting on database queries per request.",
+            self.db_seconds,
+        )
+        lines.append("# HELP http_requests_total Requests by route and status.")
+        lines.append("# TYPE http_requests_total counter")
+        for (method, route, status), count in sorted(self.statuses.items()):
+            lines.append(
+                f'http_requests_total{{method="{method}",route="{escape_label(route)}",status="{status}"}} {count}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Records every HTTP request in `metrics` under its route template.
+
+    Latency is measured until the response starts, so server-sent event
+    streams count as fast requests rather than as hour long ones. Requests
+    that match no route are grouped as "unmatched".
+    """
+
+    def __init__(self, app, metrics: RouteMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        status = 500  # if the app raises before responding
+        latency = None
+
+        async def send_with_metrics(message):
+            nonlocal status, latency
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                latency = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_stats.reset(token)
+            # The router stores the matched route in the scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            if latency is None:
+                latency = time.perf_counter() - start
+            self.metrics.record(scope["method"], route, status, latency, stats)
+
+
+routeMetrics = RouteMetrics()
@@ -0,0 +1,77 @@
+from typing import List
+
+from db_instance import database
+
+
+async def settle_market(bet_id: int, bet_options: List[dict]) -> List[int]:
+    """Settles a bet and pays out every accum it completes.
+
+    An accum wins when all of its legs have option_status 2.
+    `bet_options` holds option_id and option_status of the bet's options,
+    options of other bets in it are ignored.
+    Runs as a fixed number of set-based statements in one transaction, however
+    many accums are affected. Accums that are already paid out are never paid
+    again. Returns the user_ids that were paid.
+    """
+    statuses = {
+        int(option["option_id"]): int(option["option_status"]) for option in bet_options
+    }
+    async with database.transaction():
+        await database.execute(
+            "update bets set bet_status = 2 where bet_id = :bet_id",
+            {"bet_id": bet_id},
+        )
+        if statuses:
+            await database.execute(
+                """
+                update bet_options set option_status = v.option_status
+                from unnest(CAST(:option_ids AS int[]), CAST(:option_statuses AS int[]))
+                    as v(option_id, option_status)
+                where bet_options.option_id = v.option_id
+                and bet_options.bet = :bet_id
+                """,
+                {
+                    "bet_id": bet_id,
+                    "option_ids": list(statuses),
+                    "option_statuses": list(statuses.values()),
+                },
+            )
+
+        # Winning accums of this bet are flagged as paid, then credited grouped
+        # per user, all in one statement
+        paid = await database.fetch_all(
+            """
+            with won as (
+                update accums set paid_out = true
+                where accums.paid_out is not true
+                and accums.accum_id in (
+                    select accum_options.accum_id from accum_options
+                    join bet_options on accum_options.option_id = bet_options.option_id
+                    where bet_options.bet = :bet_id
+                )
+                and not exists (
+                    select 1 from accum_options
+                    left join bet_options on accum_options.option_id = bet_options.option_id
+                    where accum_options.accum_id = accums.accum_id
+                    and bet_options.option_status is distinct from 2
+                )
+                returning accums.user_id, accums.stake * accums.total_odds as pay_out_sum
+            ),
+            per_user as (
+                select user_id, count(*) as won_accums, sum(pay_out_sum) as pay_out_sum
+                from won group by user_id
+            ),
+            credited as (
+                update users set balance = balance + per_user.pay_out_sum
+                from per_user where users.user_id = per_user.user_id
+            )
+            insert into user_stats(user_id, won_accums, total_paid_out)
+            select user_id, won_accums, pay_out_sum from per_user
+            on conflict (user_id) do update set
+                won_accums = user_stats.won_accums + excluded.won_accums,
+                total_paid_out = user_stats.total_paid_out + excluded.total_paid_out
+            returning user_id
+            """,
+            {"bet_id": bet_id},
+        )
+    return [row["user_id"] for row in paid]
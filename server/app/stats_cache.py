@@ -0,0 +1,64 @@
+import os
+import time
+from collections import OrderedDict
+
+
+class StatsCache:
+    """Size bounded LRU cache for computed bondebridge statistics.
+
+    Entries are dropped on `invalidate`, which is called whenever a finished
+    game changes. The TTL bounds how long rounds of games still in progress
+    can be missing from cached stats.
+    """
+
+    MISS = object()
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # Format {key: (expires_at, value)}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return self.MISS
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, generation: int):
+        # A result computed before the last invalidation may already be stale
+        if generation != self.generation:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self):
+        self.generation += 1
+        self.invalidations += 1
+        self.entries.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+statsCache = StatsCache(
+    maxsize=int(os.environ.get("STATS_CACHE_SIZE", 128)),
+    ttl=float(os.environ.get("STATS_CACHE_TTL", 300)),
+)
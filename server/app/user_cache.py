@@ -0,0 +1,64 @@
+import os
+import time
+
+from db_utils import fetchDBJson
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 30))
+
+
+class UserCache:
+    """In-process cache of `users` rows keyed by username.
+
+    Every code path that writes to `users` must call `invalidate` so the
+    balance, whitelist and admin flags served from here never outlive a change
+    by more than the request that made it. The TTL only bounds staleness
+    against writes made outside this process.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.users = dict()  # Format {username: (expires_at, row)}
+        self.usernames = dict()  # user_id -> username, for invalidation by id
+        self.generation = 0  # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, username: str) -> dict:
+        """Returns the user row, or None if the user does not exist.
+
+        The returned dict is shared, callers must not mutate it.
+        """
+        cached = self.users.get(username)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        generation = self.generation
+        res = await fetchDBJson(
+            "select user_id, username, balance, firstname, lastname, admin, whitelist, created_on, last_login, number_of_logins from users where username = :username",
+            {"username": username},
+        )
+        if not res:
+            return None
+        user = res[0]
+        # A row read before the last invalidation may already be stale
+        if generation == self.generation:
+            self.users[username] = (time.monotonic() + self.ttl, user)
+            self.usernames[user["user_id"]] = username
+        return user
+
+    def invalidate(self, username: str = None, user_id: int = None):
+        self.generation += 1
+        if user_id is not None:
+            username = self.usernames.pop(int(user_id), username)
+        if username is not None:
+            self.users.pop(username, None)
+
+    def invalidate_all(self):
+        self.generation += 1
+        self.users.clear()
+        self.usernames.clear()
+
+
+userCache = UserCache(USER_CACHE_TTL)
@@ -0,0 +1,75 @@
+"""Open bets loader: per-bet option queries vs. the single aggregated query.
+
+BENCH_DATABASE_URL=postgresql://... python bench_bets.py
+"""
+
+import asyncio
+
+from common import database, print_table, reset_schema, timed
+
+from api import OPEN_BETS_CONDITION, fetch_bets_with_options
+from db_utils import fetchDBJson
+
+BET_COUNTS = [10, 100, 1000, 5000]
+OPTIONS_PER_BET = 3
+
+
+async def seed_bets(count):
+    await database.execute("TRUNCATE bet_options, bets RESTART IDENTITY CASCADE")
+    await database.execute(
+        """
+        INSERT INTO bets(category, title, is_accepted, submitter, close_timestamp)
+        SELECT 'bench', 'Bet ' || i, true, 'bench', NOW() + interval '7 days'
+        FROM generate_series(1, :count) AS i
+        """,
+        {"count": count},
+    )
+    await database.execute(
+        """
+        INSERT INTO bet_options(bet, latest_odds, option)
+        SELECT bet_id, 1.5 + o * 0.25, 'Option ' || o
+        FROM bets, generate_series(1, :options) AS o
+        """,
+        {"options": OPTIONS_PER_BET},
+    )
+
+
+async def per_bet_queries():
+    # The loader the endpoints used before: one options query per bet
+    bets = await fetchDBJson(
+        f"select * from bets where {OPEN_BETS_CONDITION} ORDER BY close_timestamp ASC"
+    )
+    for bet in bets:
+        bet["bet_options"] = await fetchDBJson(
+            "select option_id, latest_odds, option_status, option from bet_options where bet = :bet",
+            {"bet": bet["bet_id"]},
+        )
+    return bets
+
+
+async def single_query():
+    return await fetch_bets_with_options(
+        OPEN_BETS_CONDITION, "bets.close_timestamp ASC"
+    )
+
+
+async def main():
+    await database.connect()
+    try:
+        await reset_schema()
+        rows = []
+        for count in BET_COUNTS:
+            await seed_bets(count)
+            repeat = 5 if count >= 1000 else 20
+            old = await timed(per_bet_queries, repeat)
+            new = await timed(single_query, repeat)
+            rows.append((count, *old, *new))
+        print_table(
+            ("bets", "per-bet p50", "per-bet p95", "single p50", "single p95"), rows
+        )
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,203 @@
+"""Bulk earnings engine vs. the per-game settlement it replaced.
+
+Runs without a database: games are generated in memory, settle_games summed
+up per player must agree exactly with the reference on every randomized case
+before any timing is reported. The player and favorite filters are not part of
+it, calc_player_earnings applies them in SQL over the stored game_results.
+
+    python bench_earnings.py [num_games]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from earnings import settle_games  # noqa: E402
+
+NICKNAMES = [f"player{i}" for i in range(1, 13)]
+
+
+def reference_player_earnings(games):
+    # The original calc_player_earnings loop, one game at a time, unfiltered
+    player_earnings = dict()
+    player_nicknames = dict()
+    player_games_count = dict()
+
+    for game, players in games:
+        players = list(players)
+        for player in players:
+            player_nicknames[player["player_id"]] = player["nickname"]
+
+        players.sort(key=lambda x: x["score"], reverse=True)
+
+        if len(players) < 4:
+            continue
+        first_place, last_place = players[0], players[-1]
+        second_place, second_last_place = players[1], players[-2]
+
+        first_place_earnings = second_place_earnings = 0
+        last_place_earnings = second_last_earnings = 0
+
+        if first_place["score"] == second_place["score"]:
+            total_earnings = (
+                (first_place["score"] - last_place["score"]) * game["money_multiplier"]
+                + game["extra_cost_loser"]
+            ) + (
+                (second_place["score"] - second_last_place["score"])
+                * game["money_multiplier"]
+                + game["extra_cost_second_last"]
+            )
+            first_place_earnings = second_place_earnings = total_earnings / 2
+        else:
+            first_place_earnings = (first_place["score"] - last_place["score"]) * game[
+                "money_multiplier"
+            ] + game["extra_cost_loser"]
+            second_place_earnings = (
+                second_place["score"] - second_last_place["score"]
+            ) * game["money_multiplier"] + game["extra_cost_second_last"]
+
+        if last_place["score"] == second_last_place["score"]:
+            total_loss = -(first_place_earnings + second_place_earnings)
+            last_place_earnings = second_last_earnings = total_loss / 2
+        else:
+            last_place_earnings = -first_place_earnings
+            second_last_earnings = -second_place_earnings
+
+        if (
+            first_place["score"]
+            == second_place["score"]
+            == second_last_place["score"]
+            == last_place["score"]
+        ):
+            first_place_earnings = second_place_earnings = second_last_earnings = (
+                last_place_earnings
+            ) = 0
+        elif (
+            first_place["score"] == second_place["score"] == second_last_place["score"]
+        ):
+            first_place_earnings = second_place_earnings = second_last_earnings = (
+                last_place_earnings / 3
+            )
+        elif second_place["score"] == second_last_place["score"] == last_place["score"]:
+            second_place_earnings = second_last_earnings = last_place_earnings = 0
+        if second_last_place["score"] == second_place["score"]:
+            second_last_earnings = second_place_earnings = 0
+
+        for player in players:
+            player_id = player["player_id"]
+            if player_id == first_place["player_id"]:
+                earnings = first_place_earnings
+            elif player_id == last_place["player_id"]:
+                earnings = last_place_earnings
+            elif player_id == second_place["player_id"]:
+                earnings = second_place_earnings
+            elif player_id == second_last_place["player_id"]:
+                earnings = second_last_earnings
+            else:
+                earnings = 0
+
+            if player_id in player_earnings:
+                player_earnings[player_id] += earnings
+                player_games_count[player_id] += 1
+            else:
+                player_earnings[player_id] = earnings
+                player_games_count[player_id] = 1
+
+    avg_earnings = {
+        player_id: round(player_earnings[player_id] / player_games_count[player_id], 1)
+        for player_id in player_earnings
+    }
+    return {
+        player_nicknames[player_id]: {
+            "total_earnings": earnings,
+            "num_games": player_games_count[player_id],
+            "avg_earnings": avg_earnings[player_id],
+        }
+        for player_id, earnings in player_earnings.items()
+        if player_id in player_nicknames
+    }
+
+
+def random_games(num_games, rng):
+    games = []
+    for game_id in range(1, num_games + 1):
+        game = {
+            "game_id": game_id,
+            "money_multiplier": rng.choice([1, 2, 5]),
+            "extra_cost_loser": rng.choice([0, 10, 20]),
+            "extra_cost_second_last": rng.choice([0, 5, 10]),
+        }
+        num_players = rng.choice([3, 4, 4, 4, 5, 6])
+        # Narrow score ranges make ties, the interesting cases, common
+        high = rng.choice([2, 5, 60])
+        players = [
+            {
+                "player_id": player_id,
+                "nickname": NICKNAMES[player_id - 1],
+                "score": rng.randint(-5, high),
+            }
+            for player_id in rng.sample(range(1, len(NICKNAMES) + 1), num_players)
+        ]
+        games.append((game, players))
+    return games
+
+
+def as_rows(games):
+    return [{**game, **player} for game, players in games for player in players]
+
+
+def bulk_player_earnings(rows):
+    # settle_games summed per player in settlement order, as game_results are
+    flat_rows, flat_earnings, _ = settle_games(rows)
+    player_earnings = dict()
+    player_games_count = dict()
+    for i, earnings in zip(flat_rows, flat_earnings):
+        nickname = rows[i]["nickname"]
+        player_earnings[nickname] = player_earnings.get(nickname, 0) + earnings.item()
+        player_games_count[nickname] = player_games_count.get(nickname, 0) + 1
+    return {
+        nickname: {
+            "total_earnings": earnings,
+            "num_games": player_games_count[nickname],
+            "avg_earnings": round(earnings / player_games_count[nickname], 1),
+        }
+        for nickname, earnings in player_earnings.items()
+    }
+
+
+def check_equivalence(cases=300, rng=None):
+    rng = rng or random.Random(42)
+    for case in range(cases):
+        games = random_games(rng.randint(1, 60), rng)
+        expected = reference_player_earnings(games)
+        actual = bulk_player_earnings(as_rows(games))
+        if expected != actual or list(expected) != list(actual):
+            sys.exit(
+                f"Mismatch in case {case}:\n" f"expected {expected}\nactual   {actual}"
+            )
+    print(f"{cases} randomized cases: bulk engine matches the reference")
+
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    check_equivalence()
+
+    games = random_games(num_games, random.Random(7))
+    rows = as_rows(games)
+    start = time.perf_counter()
+    reference_player_earnings(games)
+    reference_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    settle_games(rows)
+    bulk_ms = (time.perf_counter() - start) * 1000
+    print(
+        f"{num_games} games: reference {reference_ms:.1f} ms, bulk {bulk_ms:.1f} ms "
+        "(the reference also sums per player and paid one query per game)"
+    )
+
+
+if __name__ == "__main__":
+    main()
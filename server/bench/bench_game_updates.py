@@ -0,0 +1,187 @@
+"""PUT /rounds and PUT /playerdata: per-row UPDATEs vs. one set-based UPDATE.
+
+Reports latency and the number of statements sent per request for growing
+games. The per-row numbers grow with rounds x players, the set-based ones stay
+constant (BEGIN/COMMIT of the transaction come on top of the counted ones).
+
+BENCH_DATABASE_URL=postgresql://... python bench_game_updates.py
+"""
+
+import asyncio
+import random
+
+from common import (
+    count_statements,
+    database,
+    print_table,
+    reset_schema,
+    statements,
+    timed,
+)
+
+from bondebridge import (
+    GameCreate,
+    RoundCreate,
+    RoundsCreate,
+    bb_router,
+    create_game,
+    create_rounds,
+    update_player_scores,
+)
+
+GAME_SIZES = [(4, 10), (4, 20), (6, 20), (8, 40)]  # (players, rounds)
+
+# Two endpoints share the name update_round, so look PUT /rounds up by route
+update_rounds = next(
+    route.endpoint
+    for route in bb_router.routes
+    if route.path == "/rounds" and "PUT" in route.methods
+)
+
+
+async def seed_game(num_players, num_rounds):
+    await database.execute(
+        """
+        INSERT INTO bonde_users(nickname)
+        SELECT 'player ' || i FROM generate_series(1, :count) AS i
+        ON CONFLICT DO NOTHING
+        """,
+        {"count": num_players},
+    )
+    game = await create_game(
+        GameCreate(
+            money_multiplier=1,
+            extra_cost_loser=0,
+            extra_cost_second_last=0,
+            players=list(range(1, num_players + 1)),
+        )
+    )
+    rounds = await create_rounds(
+        RoundsCreate(
+            game_id=game["game_id"],
+            game_player_ids=game["game_player_ids"],
+            rounds=[
+                RoundCreate(
+                    dealer_index=i % num_players,
+                    locked=False,
+                    num_cards=10,
+                    player_scores=[],
+                )
+                for i in range(num_rounds)
+            ],
+        )
+    )
+    return game["game_player_ids"], rounds["player_scores_ids"]
+
+
+def rounds_payload(player_scores_ids):
+    # The client resends the whole game, here with every score changed
+    return {
+        "rounds": [
+            {
+                "player_scores": [
+                    {
+                        "player_scores_id": player_scores_id,
+                        "num_tricks": random.randint(0, 10),
+                        "stand": random.random() < 0.5,
+                    }
+                    for player_scores_id in round_scores
+                ]
+            }
+            for round_scores in player_scores_ids
+        ]
+    }
+
+
+def playerdata_payload(game_player_ids):
+    return {
+        "playerData": [
+            {
+                "game_player_id": game_player_id,
+                "score": random.randint(0, 200),
+                "warnings": random.randint(0, 3),
+                "bleedings": random.randint(0, 3),
+            }
+            for game_player_id in game_player_ids
+        ]
+    }
+
+
+async def per_row_rounds(data):
+    # What PUT /rounds did before: one UPDATE per score, no transaction
+    for round in data["rounds"]:
+        for player_score in round["player_scores"]:
+            await database.execute(
+                """
+                UPDATE player_scores
+                SET num_tricks = :num_tricks, stand = :stand
+                WHERE player_scores_id = :player_scores_id
+                """,
+                player_score,
+            )
+
+
+async def per_row_playerdata(data):
+    for player in data["playerData"]:
+        await database.execute(
+            """
+            UPDATE game_players
+            SET score = :score, warnings = :warnings, bleedings = :bleedings
+            WHERE game_player_id = :game_player_id
+            """,
+            player,
+        )
+
+
+async def main():
+    await database.connect()
+    count_statements()
+    try:
+        await reset_schema()
+        rows = []
+        for num_players, num_rounds in GAME_SIZES:
+            game_player_ids, player_scores_ids = await seed_game(
+                num_players, num_rounds
+            )
+            benches = [
+                (
+                    "/rounds",
+                    lambda: per_row_rounds(rounds_payload(player_scores_ids)),
+                    lambda: update_rounds(rounds_payload(player_scores_ids)),
+                ),
+                (
+                    "/playerdata",
+                    lambda: per_row_playerdata(playerdata_payload(game_player_ids)),
+                    lambda: update_player_scores(playerdata_payload(game_player_ids)),
+                ),
+            ]
+            for endpoint, old, new in benches:
+                rows.append(
+                    (
+                        endpoint,
+                        f"{num_players}x{num_rounds}",
+                        await statements(old),
+                        *await timed(old),
+                        await statements(new),
+                        *await timed(new),
+                    )
+                )
+        print_table(
+            (
+                "endpoint",
+                "players x rounds",
+                "per-row stmts",
+                "p50",
+                "p95",
+                "set stmts",
+                "p50",
+                "p95",
+            ),
+            rows,
+        )
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
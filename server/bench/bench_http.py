@@ -0,0 +1,127 @@
+"""Large list endpoints with and without the ETag and compression middleware.
+
+Serves the same routers twice in-process: bare (as main.py was with only CORS)
+and as main.app. For each endpoint it reports bytes on the wire and latency
+for a plain GET, and for the revalidating GET a browser sends once it holds
+the body (If-None-Match), which the middleware answers with an empty 304.
+
+BENCH_DATABASE_URL=postgresql://... python bench_http.py
+"""
+
+import asyncio
+
+import httpx
+from common import database, print_table, reset_schema, timed
+from fastapi import FastAPI
+
+from api import api_router
+from auth_utils import authUtils
+from bondebridge import bb_router
+from main import app as main_app
+
+REPEAT = 50
+
+
+def bare_app():
+    app = FastAPI()
+    app.include_router(api_router)
+    app.include_router(bb_router, prefix="/api/bonde")
+    return app
+
+
+async def seed():
+    await database.execute("""
+        INSERT INTO users(username, password, admin)
+        SELECT 'user' || i, 'x', i = 1 FROM generate_series(1, 500) AS i
+        """)
+    await database.execute("""
+        INSERT INTO dictionary(word, description, frequency, submitter)
+        SELECT 'word ' || i, repeat('A rather long description. ', 5), i % 10, 'user1'
+        FROM generate_series(1, 2000) AS i
+        """)
+    await database.execute("""
+        INSERT INTO bets(category, title, is_accepted, submitter, close_timestamp)
+        SELECT 'bench', 'Bet ' || i, true, 'user1', NOW() + interval '7 days'
+        FROM generate_series(1, 50) AS i
+        """)
+    await database.execute("""
+        INSERT INTO bet_options(bet, latest_odds, option)
+        SELECT bet_id, 1.5 + o * 0.25, 'Option ' || o
+        FROM bets, generate_series(1, 3) AS o
+        """)
+    await database.execute("""
+        INSERT INTO accums(stake, total_odds, user_id)
+        SELECT 10 + i % 90, 2.5, 1 + i % 500 FROM generate_series(1, 2000) AS i
+        """)
+    await database.execute("""
+        INSERT INTO accum_options(accum_id, option_id, user_odds)
+        SELECT accum_id, 1 + (accum_id * 7 + l) % 150, 2
+        FROM accums, generate_series(0, 2) AS l
+        """)
+    await database.execute("""
+        INSERT INTO bonde_users(nickname)
+        SELECT 'player ' || i FROM generate_series(1, 200) AS i
+        """)
+
+
+async def measure(client, path, headers):
+    response = await client.get(path, headers=headers)
+    response.raise_for_status()
+    etag = response.headers.get("etag")
+    revalidate_headers = {**headers, "If-None-Match": etag} if etag else headers
+    revalidated = await client.get(path, headers=revalidate_headers)
+
+    full_latency = await timed(lambda: client.get(path, headers=headers), REPEAT)
+    revalidate_latency = await timed(
+        lambda: client.get(path, headers=revalidate_headers), REPEAT
+    )
+    return (
+        response.num_bytes_downloaded,
+        full_latency[1],
+        revalidated.status_code,
+        revalidated.num_bytes_downloaded,
+        revalidate_latency[1],
+    )
+
+
+async def main():
+    await database.connect()
+    try:
+        await reset_schema()
+        await seed()
+        token = await authUtils.create_access_token("user1", 1)
+        auth = {"Authorization": f"Bearer {token}"}
+        endpoints = [
+            ("/api/dictionary", auth),
+            ("/api/allaccums?limit=500", auth),
+            ("/api/admin/users", auth),
+            ("/api/bonde/games", {}),
+            ("/api/bonde/users", {}),
+        ]
+
+        rows = []
+        for name, app in (("before", bare_app()), ("after", main_app)):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench"
+            ) as client:
+                for path, headers in endpoints:
+                    rows.append((name, path, *await measure(client, path, headers)))
+        print_table(
+            (
+                "app",
+                "endpoint",
+                "bytes",
+                "p95 ms",
+                "revalidate",
+                "bytes",
+                "p95 ms",
+            ),
+            rows,
+        )
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
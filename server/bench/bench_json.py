@@ -0,0 +1,94 @@
+"""Serializing a large accum feed: jsonable_encoder + JSONResponse vs. FastJSONResponse.
+
+Runs without a database: the feed is generated in memory with the types the
+rows come back with (Decimal stakes and odds, timezone aware timestamps, the
+nested accumBets lists). Both bodies must decode to the same JSON before any
+timing is reported.
+
+    python bench_json.py [num_accums]
+"""
+
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from fast_json import FastJSONResponse, orjson  # noqa: E402
+
+REPEAT = 20
+
+
+def accum_feed(num_accums, rng):
+    # Shaped like fetch_accums_with_bets rows, newest first
+    placed = datetime.datetime(2024, 6, 1, 12, tzinfo=datetime.timezone.utc)
+    feed = []
+    for accum_id in range(num_accums, 0, -1):
+        placed -= datetime.timedelta(seconds=rng.randint(1, 600))
+        feed.append(
+            {
+                "accum_id": accum_id,
+                "stake": Decimal(rng.randint(100, 10000)) / 100,
+                "total_odds": Decimal(rng.randint(110, 5000)) / 100,
+                "username": f"user{rng.randint(1, 200)}",
+                "placed_timestamp": placed.replace(
+                    microsecond=rng.choice([0, rng.randint(1, 999999)])
+                ),
+                "accumBets": [
+                    {
+                        "title": f"Bet {rng.randint(1, 500)}",
+                        "user_odds": Decimal(rng.randint(110, 400)) / 100,
+                        "option": f"Option {rng.randint(1, 3)}",
+                        "option_status": rng.randint(1, 3),
+                    }
+                    for _ in range(rng.randint(1, 4))
+                ],
+            }
+        )
+    return feed
+
+
+def before(feed):
+    return JSONResponse(jsonable_encoder(feed)).body
+
+
+def after(feed):
+    return FastJSONResponse(feed).body
+
+
+def timed(func, feed):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(feed)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return statistics.median(samples), p95
+
+
+def main():
+    num_accums = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    feed = accum_feed(num_accums, random.Random(42))
+
+    expected, actual = before(feed), after(feed)
+    if json.loads(expected) != json.loads(actual):
+        sys.exit("FastJSONResponse does not encode the feed like jsonable_encoder")
+    encoder = "orjson" if orjson is not None else "json (orjson not installed)"
+    print(f"{num_accums} accums: bodies match, FastJSONResponse uses {encoder}")
+
+    for name, func in (("jsonable_encoder", before), ("FastJSONResponse", after)):
+        p50, p95 = timed(func, feed)
+        print(f"{name:<18} p50 {p50:8.1f} ms  p95 {p95:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""Load test of the hot endpoints of main:app against a throwaway Postgres.
+
+Seeds a synthetic dataset, then drives each endpoint with `--concurrency`
+clients for `--duration` seconds, followed by a mixed run over all of them,
+and reports throughput and p50/p95/p99 latency. By default the app is served
+in-process through httpx's ASGI transport. Pass `--url` to load a running
+server instead, started with DATABASE_URL set to the same database.
+
+`--save-baseline` stores the results, later runs print the change against the
+stored baseline and with `--max-regression 0.2` exit non-zero when p95 grew
+or throughput dropped by more than 20% on any endpoint. Baselines are only
+comparable on the same machine with the same concurrency and duration.
+
+BENCH_DATABASE_URL=postgresql://... python bench_load.py [--concurrency 20] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import httpx
+from common import database, print_table, reset_schema
+
+from auth_utils import authUtils
+from db_utils import fetchDBJson
+from game_results import store_game_results
+from main import app
+from maintenance import rebuild_leaderboard
+
+NUM_USERS = 500
+NUM_OPEN_BETS = 50
+NUM_ACCUMS = 20000
+NUM_PLAYERS = 12
+NUM_GAMES = 300
+STATS_QUERIES = [
+    "",
+    "?onlyfavorite=true",
+    "?playerIds=1,4,7,10",
+    "?playerIds=2,5,8,11&exclusiveselect=true",
+    "?from_date=2000-01-01&to_date=2100-01-01",
+]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "load_baseline.json")
+
+
+async def seed():
+    await database.execute(
+        """
+        INSERT INTO users(username, password, admin)
+        SELECT 'user' || i, 'x', i = 1 FROM generate_series(1, :count) AS i
+        """,
+        {"count": NUM_USERS},
+    )
+    await database.execute(
+        """
+        INSERT INTO bets(category, title, is_accepted, submitter, close_timestamp)
+        SELECT 'bench', 'Bet ' || i, true, 'user1', NOW() + interval '7 days'
+        FROM generate_series(1, :count) AS i
+        """,
+        {"count": NUM_OPEN_BETS},
+    )
+    await database.execute("""
+        INSERT INTO bet_options(bet, latest_odds, option)
+        SELECT bet_id, 1.5 + o * 0.25, 'Option ' || o
+        FROM bets, generate_series(1, 3) AS o
+        ORDER BY bet_id, o
+        """)
+    await database.execute(
+        """
+        INSERT INTO accums(stake, total_odds, user_id, placed_timestamp)
+        SELECT 10 + i % 90, 2.5, 1 + i % :users, NOW() - i * interval '1 minute'
+        FROM generate_series(1, :count) AS i
+        """,
+        {"users": NUM_USERS, "count": NUM_ACCUMS},
+    )
+    await database.execute(
+        """
+        INSERT INTO accum_options(accum_id, option_id, user_odds)
+        SELECT accum_id, 1 + (accum_id * 7 + l * 3) % (3 * :bets), 2
+        FROM accums, generate_series(0, 2) AS l
+        """,
+        {"bets": NUM_OPEN_BETS},
+    )
+    await rebuild_leaderboard()
+
+    # Finished games of four players each, every tenth one still in progress
+    await database.execute(
+        """
+        INSERT INTO bonde_users(nickname, favorite)
+        SELECT 'player ' || i, i <= :count / 2 FROM generate_series(1, :count) AS i
+        """,
+        {"count": NUM_PLAYERS},
+    )
+    await database.execute(
+        """
+        INSERT INTO games(money_multiplier, extra_cost_loser, extra_cost_second_last, status, created_on)
+        SELECT 1, 50, 20,
+            CASE WHEN i % 10 = 0 THEN 'in_progress' ELSE 'finished' END,
+            NOW() - i * interval '1 day'
+        FROM generate_series(1, :count) AS i
+        """,
+        {"count": NUM_GAMES},
+    )
+    await database.execute(
+        """
+        INSERT INTO game_players(game_id, player_id, score, warnings, bleedings)
+        SELECT game_id, (game_id + k * 3) % :players + 1, floor(random() * 200),
+            floor(random() * 3), floor(random() * 3)
+        FROM games, generate_series(0, 3) AS k
+        ORDER BY game_id, k
+        """,
+        {"players": NUM_PLAYERS},
+    )
+    await database.execute("""
+        INSERT INTO rounds(game_id, num_cards, dealer_index, locked)
+        SELECT game_id, 1 + r % 10, r % 4, true
+        FROM games, generate_series(0, 19) AS r
+        ORDER BY game_id, r
+        """)
+    await database.execute("""
+        INSERT INTO player_scores(round_id, game_player_id, num_tricks, stand)
+        SELECT round_id, game_player_id, floor(random() * (num_cards + 1)), random() < 0.5
+        FROM rounds JOIN game_players USING (game_id)
+        ORDER BY round_id, game_player_id
+        """)
+    await store_game_results()
+
+
+async def auth_headers():
+    headers = []
+    for user in await fetchDBJson("select user_id, username from users"):
+        token = await authUtils.create_access_token(user["username"], user["user_id"])
+        headers.append({"Authorization": f"Bearer {token}"})
+    return headers
+
+
+def jsonable_options(options):
+    # The client sends odds as JSON numbers
+    return [
+        {"option_id": option["option_id"], "latest_odds": float(option["latest_odds"])}
+        for option in options
+    ]
+
+
+class Endpoints:
+    """One request per method, each returns whether it succeeded."""
+
+    def __init__(self, tokens, options):
+        self.tokens = tokens  # one bearer header per user
+        self.options = options  # the open bet options
+
+    def auth(self, rng):
+        return rng.choice(self.tokens)
+
+    async def openbets(self, client, rng):
+        response = await client.get("/api/openbets", headers=self.auth(rng))
+        return response.is_success
+
+    async def placebet(self, client, rng):
+        legs = rng.sample(self.options, rng.randint(1, 3))
+        total_odds = 1
+        for leg in legs:
+            total_odds *= float(leg["latest_odds"])
+        response = await client.post(
+            "/api/placebet",
+            headers=self.auth(rng),
+            json={
+                "stake": 1,
+                "totalodds": round(total_odds, 2),
+                "bets": [{"option": leg} for leg in legs],
+            },
+        )
+        return response.is_success and response.json()["placeBet"]
+
+    async def leaderboard(self, client, rng):
+        response = await client.get("/api/leaderboard", headers=self.auth(rng))
+        return response.is_success
+
+    async def allaccums(self, client, rng):
+        response = await client.get("/api/allaccums", headers=self.auth(rng))
+        return response.is_success
+
+    async def game(self, client, rng):
+        response = await client.get(f"/api/bonde/game/{rng.randint(1, NUM_GAMES)}")
+        return response.is_success
+
+    async def stats(self, client, rng):
+        # Repeats are served by the stats cache, as they are in production
+        response = await client.get(f"/api/bonde/stats{rng.choice(STATS_QUERIES)}")
+        return response.is_success
+
+    def all(self):
+        return {
+            "/api/openbets": self.openbets,
+            "/api/placebet": self.placebet,
+            "/api/leaderboard": self.leaderboard,
+            "/api/allaccums": self.allaccums,
+            "/api/bonde/game/{id}": self.game,
+            "/api/bonde/stats": self.stats,
+        }
+
+
+async def drive(client, requests, concurrency, duration):
+    """Runs `concurrency` clients for `duration` seconds, each picking one of
+    `requests` per iteration. Returns (latencies in ms, errors, seconds)."""
+    latencies = []
+    errors = 0
+
+    async def run_client(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            request = rng.choice(requests)
+            start = time.perf_counter()
+            try:
+                ok = await request(client, rng)
+            except httpx.HTTPError:
+                ok = False
+            latencies.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(run_client(seed) for seed in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed):
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+
+    def percentile(p):
+        return round(percentiles[p - 1], 2) if percentiles else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "p99": percentile(99),
+    }
+
+
+def change(current, baseline):
+    if not baseline:
+        return "-"
+    return f"{(current - baseline) / baseline:+.0%}"
+
+
+def regressions(results, baseline, max_regression):
+    failed = []
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if not before or not before["p95"] or not result["p95"]:
+            continue
+        if result["p95"] > before["p95"] * (1 + max_regression):
+            failed.append(f"{name}: p95 {before['p95']} -> {result['p95']} ms")
+        if result["rps"] < before["rps"] * (1 - max_regression):
+            failed.append(f"{name}: {before['rps']} -> {result['rps']} req/s")
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--url", help="load a running server instead of main:app")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--max-regression", type=float)
+    return parser.parse_args()
+
+
+async def main(args):
+    await database.connect()
+    try:
+        await reset_schema()
+        await seed()
+        options = await fetchDBJson("select option_id, latest_odds from bet_options")
+        endpoints = Endpoints(await auth_headers(), jsonable_options(options)).all()
+
+        if args.url:
+            transport, base_url = None, args.url
+        else:
+            transport, base_url = httpx.ASGITransport(app=app), "http://bench"
+        limits = httpx.Limits(max_connections=args.concurrency)
+        results = {}
+        async with httpx.AsyncClient(
+            transport=transport, base_url=base_url, limits=limits, timeout=30
+        ) as client:
+            runs = [(name, [request]) for name, request in endpoints.items()]
+            runs.append(("mixed", list(endpoints.values())))
+            for name, requests in runs:
+                print(f"Loading {name} ...", file=sys.stderr)
+                results[name] = summarize(
+                    *await drive(client, requests, args.concurrency, args.duration)
+                )
+    finally:
+        await database.disconnect()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if (baseline["concurrency"], baseline["duration"]) != (
+            args.concurrency,
+            args.duration,
+        ):
+            print(
+                f"Baseline was run with concurrency {baseline['concurrency']} "
+                f"and duration {baseline['duration']}, changes are not comparable"
+            )
+
+    print(f"\nconcurrency {args.concurrency}, {args.duration:g} s per run\n")
+    rows = []
+    for name, result in results.items():
+        before = (baseline or {"results": {}})["results"].get(name, {})
+        rows.append(
+            (
+                name,
+                result["requests"],
+                result["errors"],
+                result["rps"],
+                result["p50"],
+                result["p95"],
+                result["p99"],
+                change(result["rps"], before.get("rps")),
+                change(result["p95"], before.get("p95")),
+            )
+        )
+    print_table(
+        (
+            "endpoint",
+            "requests",
+            "errors",
+            "req/s",
+            "p50 ms",
+            "p95 ms",
+            "p99 ms",
+            "req/s vs base",
+            "p95 vs base",
+        ),
+        rows,
+    )
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(
+                {
+                    "concurrency": args.concurrency,
+                    "duration": args.duration,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+        print(f"\nBaseline saved to {args.baseline}")
+    elif baseline and args.max_regression is not None:
+        failed = regressions(results, baseline, args.max_regression)
+        if failed:
+            sys.exit("Regressions against the baseline:\n" + "\n".join(failed))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,211 @@
+"""Bet settlement: per-accum queries vs. the set-based settle_market.
+
+Seeds one popular market with many accums, settles it with both
+implementations from the same starting state and checks that balances,
+paid_out flags and statuses come out identical before reporting timings.
+The reference is the per-accum loop settle_bet ran before settle_market,
+which kept no user_stats and paid again when a bet was settled twice, so
+those two behaviours of settle_market are checked on their own.
+
+BENCH_DATABASE_URL=postgresql://... python bench_settlement.py [num_accums]
+"""
+
+import asyncio
+import random
+import sys
+import time
+from decimal import Decimal
+
+from common import (
+    count_statements,
+    database,
+    print_table,
+    reset_schema,
+    statements,
+)
+
+from db_utils import fetchDBJson, insertDB
+from settlement import settle_market
+
+NUM_USERS = 200
+OTHER_BETS = 20
+OPTIONS_PER_BET = 3
+MARKET_BET_ID = 1
+
+
+async def seed(num_accums, seed=42):
+    rng = random.Random(seed)
+    await database.execute(
+        "TRUNCATE user_stats, accum_options, accums, bet_options, bets, users RESTART IDENTITY CASCADE"
+    )
+    await database.execute(
+        """
+        INSERT INTO users(username, password)
+        SELECT 'user' || i, 'x' FROM generate_series(1, :count) AS i
+        """,
+        {"count": NUM_USERS},
+    )
+    await database.execute(
+        """
+        INSERT INTO bets(category, title, is_accepted, submitter)
+        SELECT 'bench', 'Bet ' || i, true, 'bench' FROM generate_series(1, :count) AS i
+        """,
+        {"count": OTHER_BETS + 1},
+    )
+    # Options of the other bets are settled already, the first one of each won
+    await database.execute(
+        """
+        INSERT INTO bet_options(bet, latest_odds, option, option_status)
+        SELECT bet_id, 2, 'Option ' || o,
+            CASE WHEN bet_id = :market THEN 1 WHEN o = 1 THEN 2 ELSE 3 END
+        FROM bets, generate_series(1, :options) AS o
+        ORDER BY bet_id, o
+        """,
+        {"market": MARKET_BET_ID, "options": OPTIONS_PER_BET},
+    )
+
+    stakes, odds, user_ids, legs = [], [], [], []
+    for accum_id in range(1, num_accums + 1):
+        stakes.append(Decimal(rng.randint(100, 10000)) / 100)
+        odds.append(Decimal(rng.randint(110, 2000)) / 100)
+        user_ids.append(rng.randint(1, NUM_USERS))
+        # One leg on the market plus up to two on other, already settled bets
+        legs.append((accum_id, rng.randint(1, OPTIONS_PER_BET)))
+        for bet in rng.sample(range(2, OTHER_BETS + 2), rng.randint(0, 2)):
+            option = (bet - 1) * OPTIONS_PER_BET + rng.randint(1, OPTIONS_PER_BET)
+            legs.append((accum_id, option))
+    await database.execute(
+        """
+        INSERT INTO accums(stake, total_odds, user_id)
+        SELECT * FROM unnest(CAST(:stakes AS numeric[]), CAST(:odds AS numeric[]), CAST(:user_ids AS int[]))
+        """,
+        {"stakes": stakes, "odds": odds, "user_ids": user_ids},
+    )
+    await database.execute(
+        """
+        INSERT INTO accum_options(accum_id, option_id, user_odds)
+        SELECT accum_id, option_id, 2
+        FROM unnest(CAST(:accum_ids AS int[]), CAST(:option_ids AS int[])) AS l(accum_id, option_id)
+        """,
+        {
+            "accum_ids": [accum_id for accum_id, _ in legs],
+            "option_ids": [option_id for _, option_id in legs],
+        },
+    )
+
+
+def market_options():
+    # The first option of the market won
+    return [
+        {"option_id": option, "option_status": 2 if option == 1 else 3}
+        for option in range(1, OPTIONS_PER_BET + 1)
+    ]
+
+
+async def per_accum_settlement(bet_id, bet_options):
+    # The settle_bet loop before settle_market: a few queries per accum
+    async with database.transaction():
+        await insertDB(
+            "update bets set bet_status = 2 where bet_id = :bet_id",
+            {"bet_id": bet_id},
+        )
+        for option in bet_options:
+            await insertDB(
+                "update bet_options set option_status = :option_status where option_id = :option_id",
+                option,
+            )
+        accum_ids = await fetchDBJson(
+            "select distinct accum_id from accums natural join accum_options natural join bet_options where bet = :bet_id",
+            {"bet_id": bet_id},
+        )
+        for accum in accum_ids:
+            accum_id = accum["accum_id"]
+            accum = await fetchDBJson(
+                "select option_status, stake, total_odds, user_id from accum_options left join bet_options on accum_options.option_id = bet_options.option_id left join accums on accum_options.accum_id = accums.accum_id where accums.accum_id = :accum_id",
+                {"accum_id": accum_id},
+            )
+            if all(option["option_status"] == 2 for option in accum):
+                await insertDB(
+                    "update users set balance = balance + :pay_out_sum where user_id = :user_id",
+                    {
+                        "pay_out_sum": accum[0]["stake"] * accum[0]["total_odds"],
+                        "user_id": accum[0]["user_id"],
+                    },
+                )
+                await insertDB(
+                    "update accums set paid_out = true where accum_id = :accum_id",
+                    {"accum_id": accum_id},
+                )
+
+
+async def outcome():
+    return (
+        await fetchDBJson("select user_id, balance from users order by user_id"),
+        await fetchDBJson("select accum_id from accums where paid_out order by 1"),
+        await fetchDBJson(
+            "select option_id, option_status from bet_options order by 1"
+        ),
+        await fetchDBJson("select bet_id, bet_status from bets order by 1"),
+    )
+
+
+async def check_user_stats():
+    # The seed has no user_stats, so they must hold exactly the paid accums
+    expected = await fetchDBJson("""
+        select user_id, count(*) as won_accums, sum(stake * total_odds) as total_paid_out
+        from accums where paid_out group by user_id order by user_id
+        """)
+    actual = await fetchDBJson(
+        "select user_id, won_accums, total_paid_out from user_stats order by user_id"
+    )
+    if actual != expected:
+        sys.exit("settle_market user_stats do not match the paid out accums")
+
+
+async def check_double_settle():
+    # Settling the same bet again must not pay anyone twice
+    before = (await outcome(), await fetchDBJson("select * from user_stats order by 1"))
+    paid = await settle_market(MARKET_BET_ID, market_options())
+    after = (await outcome(), await fetchDBJson("select * from user_stats order by 1"))
+    if paid or after != before:
+        sys.exit("Settling the market twice paid out again")
+
+
+async def run(settle, num_accums):
+    await seed(num_accums)
+    start = time.perf_counter()
+    count = await statements(lambda: settle(MARKET_BET_ID, market_options()))
+    elapsed = round((time.perf_counter() - start) * 1000, 2)
+    return elapsed, count, await outcome()
+
+
+async def main():
+    num_accums = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    await database.connect()
+    count_statements()
+    try:
+        await reset_schema()
+        rows = []
+        for name, settle in (
+            ("per-accum", per_accum_settlement),
+            ("set-based", settle_market),
+        ):
+            elapsed, count, result = await run(settle, num_accums)
+            rows.append((name, num_accums, count, elapsed))
+            if name == "per-accum":
+                expected = result
+            elif result != expected:
+                sys.exit(f"{name} settlement does not match the per-accum payouts")
+        # The database still holds the set-based settlement
+        await check_user_stats()
+        await check_double_settle()
+        winners = len(expected[1])
+        print(f"Payouts match: {winners} of {num_accums} accums paid out")
+        print("user_stats match the payouts, settling twice pays nothing\n")
+        print_table(("settlement", "accums", "statements", "ms"), rows)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
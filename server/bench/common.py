@@ -0,0 +1,60 @@
+import os
+import statistics
+import sys
+import time
+
+# The benchmarks run against a throwaway database given by BENCH_DATABASE_URL.
+# It is exported as DATABASE_URL before the app modules are imported so the
+# app's own pool (db_instance.database) is pointed at it as well.
+BENCH_DATABASE_URL = os.environ.get("BENCH_DATABASE_URL")
+if not BENCH_DATABASE_URL:
+    sys.exit("Set BENCH_DATABASE_URL to a throwaway Postgres database")
+os.environ["DATABASE_URL"] = BENCH_DATABASE_URL
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from db_instance import database  # noqa: E402
+from route_metrics import RequestStats, request_stats, routeMetrics  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "schema.sql")
+
+
+async def reset_schema():
+    with open(SCHEMA_PATH) as schema:
+        statements = [s.strip() for s in schema.read().split(";") if s.strip()]
+    for statement in statements:
+        await database.execute(statement)
+
+
+async def timed(func, repeat=20):
+    """Runs `func` `repeat` times and returns (p50, p95) in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return round(statistics.median(samples), 2), round(p95, 2)
+
+
+def count_statements():
+    # Statements are counted the way /metrics counts them per request
+    routeMetrics.instrument(database)
+
+
+async def statements(func):
+    """Runs `func` once and returns the number of statements it sent."""
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    try:
+        await func()
+    finally:
+        request_stats.reset(token)
+    return stats.queries
+
+
+def print_table(header, rows):
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+    for row in [header, *rows]:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
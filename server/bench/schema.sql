@@ -0,0 +1,137 @@
+-- Minimal schema matching the columns the API uses. Only meant for the
+-- throwaway benchmark database, never run this against a real one.
+
+DROP TABLE IF EXISTS game_results, user_stats, player_scores, rounds, game_players, games, bonde_users,
+    competition, dictionary, accum_options, accums, bet_options, bets, users CASCADE;
+
+CREATE TABLE users (
+    user_id SERIAL PRIMARY KEY,
+    username TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    balance NUMERIC NOT NULL DEFAULT 5000,
+    firstname TEXT,
+    lastname TEXT,
+    admin BOOLEAN NOT NULL DEFAULT FALSE,
+    whitelist BOOLEAN NOT NULL DEFAULT TRUE,
+    created_on TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_login TIMESTAMPTZ,
+    number_of_logins INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE bets (
+    bet_id SERIAL PRIMARY KEY,
+    category TEXT,
+    title TEXT,
+    is_accepted BOOLEAN NOT NULL DEFAULT FALSE,
+    submitter TEXT,
+    close_timestamp TIMESTAMPTZ,
+    bet_status INTEGER NOT NULL DEFAULT 1,
+    closed_early TIMESTAMPTZ
+);
+
+CREATE TABLE bet_options (
+    option_id SERIAL PRIMARY KEY,
+    bet INTEGER NOT NULL REFERENCES bets(bet_id),
+    latest_odds NUMERIC NOT NULL,
+    option TEXT,
+    option_status INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX ON bet_options(bet);
+
+CREATE TABLE accums (
+    accum_id SERIAL PRIMARY KEY,
+    stake NUMERIC NOT NULL,
+    total_odds NUMERIC NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(user_id),
+    placed_timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    paid_out BOOLEAN NOT NULL DEFAULT FALSE
+);
+CREATE INDEX ON accums(user_id);
+CREATE INDEX ON accums(placed_timestamp DESC, accum_id DESC);
+
+CREATE TABLE accum_options (
+    accum_id INTEGER NOT NULL REFERENCES accums(accum_id),
+    option_id INTEGER NOT NULL REFERENCES bet_options(option_id),
+    user_odds NUMERIC NOT NULL
+);
+CREATE INDEX ON accum_options(accum_id);
+CREATE INDEX ON accum_options(option_id);
+
+CREATE TABLE user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+    total_accums INTEGER NOT NULL DEFAULT 0,
+    won_accums INTEGER NOT NULL DEFAULT 0,
+    total_staked NUMERIC NOT NULL DEFAULT 0,
+    total_paid_out NUMERIC NOT NULL DEFAULT 0
+);
+
+CREATE TABLE dictionary (
+    word_id SERIAL PRIMARY KEY,
+    word TEXT,
+    description TEXT,
+    frequency INTEGER,
+    submitter TEXT
+);
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX ON dictionary USING gin (word gin_trgm_ops);
+CREATE INDEX ON dictionary USING gin (description gin_trgm_ops);
+CREATE INDEX ON dictionary ((coalesce(frequency, 0)), word_id);
+
+CREATE TABLE competition (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+    registered BOOLEAN
+);
+
+CREATE TABLE bonde_users (
+    player_id SERIAL PRIMARY KEY,
+    nickname TEXT UNIQUE NOT NULL,
+    favorite BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE games (
+    game_id SERIAL PRIMARY KEY,
+    money_multiplier INTEGER NOT NULL,
+    extra_cost_loser INTEGER NOT NULL,
+    extra_cost_second_last INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'in_progress',
+    created_on TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE game_players (
+    game_player_id SERIAL PRIMARY KEY,
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    player_id INTEGER NOT NULL REFERENCES bonde_users(player_id),
+    score INTEGER NOT NULL DEFAULT 0,
+    warnings INTEGER NOT NULL DEFAULT 0,
+    bleedings INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX ON game_players(game_id);
+
+CREATE TABLE rounds (
+    round_id SERIAL PRIMARY KEY,
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    num_cards INTEGER NOT NULL,
+    dealer_index INTEGER NOT NULL,
+    locked BOOLEAN NOT NULL DEFAULT FALSE
+);
+CREATE INDEX ON rounds(game_id);
+
+CREATE TABLE player_scores (
+    player_scores_id SERIAL PRIMARY KEY,
+    round_id INTEGER NOT NULL REFERENCES rounds(round_id),
+    game_player_id INTEGER NOT NULL REFERENCES game_players(game_player_id),
+    num_tricks INTEGER,
+    stand BOOLEAN
+);
+CREATE INDEX ON player_scores(round_id);
+
+CREATE TABLE game_results (
+    game_player_id INTEGER PRIMARY KEY REFERENCES game_players(game_player_id),
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    player_id INTEGER NOT NULL REFERENCES bonde_users(player_id),
+    placement INTEGER NOT NULL,
+    earnings DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX ON game_results(game_id);
+CREATE INDEX ON game_results(player_id);
@@ -0,0 +1,6 @@
+-- Keyset pagination of the accum feeds (/api/allaccums, /api/accums, /api/useraccums/)
+CREATE INDEX IF NOT EXISTS accums_placed_timestamp_accum_id_idx
+    ON accums (placed_timestamp DESC, accum_id DESC);
+
+-- Batched leg lookup for a page of accums
+CREATE INDEX IF NOT EXISTS accum_options_accum_id_idx ON accum_options (accum_id);
@@ -0,0 +1,20 @@
+-- Per-user leaderboard counters, maintained by /api/placebet and /api/admin/settlebet.
+-- Rebuild at any time with: python server/app/maintenance.py rebuild-leaderboard
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id),
+    total_accums INTEGER NOT NULL DEFAULT 0,
+    won_accums INTEGER NOT NULL DEFAULT 0,
+    total_staked NUMERIC NOT NULL DEFAULT 0,
+    total_paid_out NUMERIC NOT NULL DEFAULT 0
+);
+
+INSERT INTO user_stats(user_id, total_accums, won_accums, total_staked, total_paid_out)
+SELECT
+    user_id,
+    count(*),
+    count(*) FILTER (WHERE paid_out),
+    coalesce(sum(stake), 0),
+    coalesce(sum(stake * total_odds) FILTER (WHERE paid_out), 0)
+FROM accums
+GROUP BY user_id
+ON CONFLICT (user_id) DO NOTHING;
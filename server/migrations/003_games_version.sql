@@ -0,0 +1,3 @@
+-- Bumped on every write to a game, its rounds, scores or players.
+-- Backs the ETag of GET /api/bonde/game/{game_id}.
+ALTER TABLE games ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,12 @@
+-- Earnings and placement of each player in a finished game, written when the
+-- game is completed. Fill it for existing games with:
+--   python server/app/maintenance.py backfill-game-results
+CREATE TABLE IF NOT EXISTS game_results (
+    game_player_id INTEGER PRIMARY KEY REFERENCES game_players(game_player_id),
+    game_id INTEGER NOT NULL REFERENCES games(game_id),
+    player_id INTEGER NOT NULL REFERENCES bonde_users(player_id),
+    placement INTEGER NOT NULL,
+    earnings DOUBLE PRECISION NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_results_game_id_idx ON game_results (game_id);
+CREATE INDEX IF NOT EXISTS game_results_player_id_idx ON game_results (player_id);
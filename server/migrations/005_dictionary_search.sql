@@ -0,0 +1,10 @@
+-- Prefix and fuzzy search over the dictionary (/api/dictionary?q=)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS dictionary_word_trgm_idx
+    ON dictionary USING gin (word gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS dictionary_description_trgm_idx
+    ON dictionary USING gin (description gin_trgm_ops);
+
+-- Keyset pagination when sorting by frequency
+CREATE INDEX IF NOT EXISTS dictionary_frequency_word_id_idx
+    ON dictionary ((coalesce(frequency, 0)), word_id);
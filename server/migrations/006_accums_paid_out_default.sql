@@ -0,0 +1,5 @@
+-- Settlement only pays accums whose paid_out is not true and placebet inserts
+-- accums without it, so new accums must start out as unpaid.
+UPDATE accums SET paid_out = false WHERE paid_out IS NULL;
+ALTER TABLE accums ALTER COLUMN paid_out SET DEFAULT false;
+ALTER TABLE accums ALTER COLUMN paid_out SET NOT NULL;